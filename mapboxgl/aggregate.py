@@ -0,0 +1,421 @@
+import base64
+from collections import Counter, OrderedDict
+import math
+
+import numpy
+
+from .errors import SourceDataError
+
+
+CLUSTER_OPERATORS = ('sum', 'min', 'max', 'mean')
+
+# each byte value with the order of its bits reversed
+BIT_REVERSE = numpy.array([int('{:08b}'.format(i)[::-1], 2) for i in range(256)], dtype='uint8')
+
+
+def point_coordinates(data):
+    """Return arrays of longitudes and latitudes of a GeoJSON FeatureCollection of points"""
+    coordinates = []
+    for feature in data['features']:
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            raise SourceDataError('Point aggregation requires GeoJSON Point features, '
+                                  'found {}.'.format(geometry.get('type')))
+        coordinates.append(geometry['coordinates'][:2])
+
+    coordinates = numpy.array(coordinates, dtype='float64').reshape(-1, 2)
+    return coordinates[:, 0], coordinates[:, 1]
+
+
+def property_values(data, name):
+    """Return a float array of a feature property with NaN for missing or non-numeric values"""
+    values = [(feature.get('properties') or {}).get(name) for feature in data['features']]
+    return numpy.array([x if isinstance(x, (int, float)) and not isinstance(x, bool) else numpy.nan
+                        for x in values], dtype='float64')
+
+
+def mercator_pixels(lon, lat, zoom, tile_size=512):
+    """Project longitudes and latitudes to Web Mercator pixel coordinates of the world at a zoom level"""
+    scale = tile_size * 2.0 ** zoom
+    x = (numpy.asarray(lon, dtype='float64') + 180.0) / 360.0 * scale
+    sin_lat = numpy.clip(numpy.sin(numpy.radians(lat)), -0.9999, 0.9999)
+    y = (0.5 - numpy.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+def mercator_lnglat(x, y, zoom, tile_size=512):
+    """Inverse of mercator_pixels"""
+    scale = tile_size * 2.0 ** zoom
+    lon = numpy.asarray(x, dtype='float64') / scale * 360.0 - 180.0
+    lat = numpy.degrees(2 * numpy.arctan(numpy.exp((0.5 - numpy.asarray(y, dtype='float64') / scale) * 2 * math.pi))
+                        - math.pi / 2)
+    return lon, lat
+
+
+def abbreviate_count(count):
+    """Abbreviated point count, as in the point_count_abbreviated property of GL JS clusters"""
+    if count >= 10000:
+        return '{}k'.format(int(round(count / 1000.0)))
+    if count >= 1000:
+        return '{:g}k'.format(round(count / 100.0) / 10)
+    return str(count)
+
+
+def aggregate_groups(values, groups, count, operator):
+    """Aggregate values by group index with one of CLUSTER_OPERATORS, ignoring NaN values"""
+    valid = ~numpy.isnan(values)
+    if operator in ('sum', 'mean'):
+        totals = numpy.bincount(groups[valid], weights=values[valid], minlength=count)
+        if operator == 'sum':
+            return totals
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            return totals / numpy.bincount(groups[valid], minlength=count)
+
+    result = numpy.full(count, numpy.inf if operator == 'min' else -numpy.inf)
+    reduce = numpy.minimum if operator == 'min' else numpy.maximum
+    reduce.at(result, groups[valid], values[valid])
+    result[numpy.isinf(result)] = numpy.nan
+    return result
+
+
+def group_keys(keys):
+    """Group non-negative integer keys; returns the sorted distinct keys, the group index of each key
+    and the size of each group. Dense key ranges are counted with bincount instead of sorting.
+    """
+    keys = numpy.asarray(keys, dtype='int64')
+    span = int(keys.max()) + 1 if len(keys) else 0
+    if span > 4 * len(keys) + 1024:
+        unique, groups, counts = numpy.unique(keys, return_inverse=True, return_counts=True)
+        return unique, groups.ravel(), counts
+
+    counts = numpy.bincount(keys, minlength=span)
+    unique = numpy.flatnonzero(counts)
+    lookup = numpy.zeros(span, dtype='int64')
+    lookup[unique] = numpy.arange(len(unique))
+    return unique, lookup[keys], counts[unique]
+
+
+def cluster_points(data, cluster_radius=30, cluster_maxzoom=14, cluster_properties=None,
+                   include_points=True, max_cluster_ratio=0.25, tile_size=512):
+    """Cluster points on a grid of cluster_radius pixels at each zoom level from 0 to cluster_maxzoom
+
+    :param data: GeoJSON FeatureCollection of points
+    :param cluster_radius: size of the grid cells in pixels (tiles are tile_size pixels wide)
+    :param cluster_maxzoom: highest zoom level with clusters
+    :param cluster_properties: dict of output property to [operator, feature property] aggregated over
+                               the points of each cluster, with operator one of sum, min, max or mean
+    :param include_points: also add all points for zoom levels above cluster_maxzoom
+    :param max_cluster_ratio: clustering stops at the first zoom level with more clusters than this
+                              fraction of the points still clustered, where clusters would barely
+                              reduce the features to draw; the points are shown from that zoom level on
+
+    Grid cells halve at each zoom level, so clusters nest from one zoom level to the next and a point
+    that leaves all clusters stays unclustered at higher zoom levels. Returns a FeatureCollection of
+    cluster centroids (with point_count and point_count_abbreviated properties like GL JS clusters)
+    and points, each with a `cluster_zoom` property: the zoom level a cluster is shown at, or the lowest
+    zoom level a point is shown from. Points still clustered when clustering stops come last, with the
+    zoom level clustering stopped at (cluster_maxzoom + 1 if it did not stop early).
+    """
+    cluster_properties = cluster_properties or {}
+    for name, (operator, _) in cluster_properties.items():
+        if operator not in CLUSTER_OPERATORS:
+            raise ValueError('cluster property {} operator must be one of {}'.format(
+                name, ', '.join(CLUSTER_OPERATORS)))
+
+    lon, lat = point_coordinates(data)
+    values = OrderedDict((name, property_values(data, prop)) for name, (_, prop) in cluster_properties.items())
+    points = data['features']
+    shown = numpy.zeros(len(points), dtype=bool)
+
+    def add_point(index, zoom):
+        point = dict(points[index])
+        point['properties'] = OrderedDict(point.get('properties') or {}, cluster_zoom=zoom)
+        features.append(point)
+        shown[index] = True
+
+    features = []
+    stop_zoom = cluster_maxzoom + 1
+    for zoom in range(cluster_maxzoom + 1):
+        if shown.all():
+            break
+
+        x, y = mercator_pixels(lon, lat, zoom, tile_size)
+        cells = int(math.ceil(tile_size * 2.0 ** zoom / cluster_radius)) + 1
+        keys = numpy.floor(x / cluster_radius).astype('int64') * cells + numpy.floor(y / cluster_radius).astype('int64')
+        _, groups, counts = group_keys(keys)
+
+        # clusters only hold points not shown yet, since clusters nest
+        if numpy.count_nonzero(counts > 1) > max_cluster_ratio * numpy.count_nonzero(~shown):
+            stop_zoom = zoom
+            break
+
+        # centroids are averaged in projected coordinates
+        center_lon, center_lat = mercator_lnglat(numpy.bincount(groups, weights=x) / counts,
+                                                 numpy.bincount(groups, weights=y) / counts,
+                                                 zoom, tile_size)
+        aggregates = OrderedDict((name, aggregate_groups(column, groups, len(counts), cluster_properties[name][0]))
+                                 for name, column in values.items())
+
+        # clusters of a single point are shown as the point itself
+        point_index = numpy.zeros(len(counts), dtype='int64')
+        point_index[groups] = numpy.arange(len(groups))
+
+        for group, count in enumerate(counts.tolist()):
+            if count == 1:
+                if not shown[point_index[group]]:
+                    add_point(point_index[group], zoom)
+                continue
+
+            properties = OrderedDict([('cluster', True),
+                                      ('point_count', count),
+                                      ('point_count_abbreviated', abbreviate_count(count))])
+            for name, column in aggregates.items():
+                value = column[group]
+                properties[name] = None if numpy.isnan(value) else float(value)
+            properties['cluster_zoom'] = zoom
+
+            features.append({'type': 'Feature',
+                             'geometry': {'type': 'Point',
+                                          'coordinates': [float(center_lon[group]), float(center_lat[group])]},
+                             'properties': properties})
+
+    if include_points or stop_zoom <= cluster_maxzoom:
+        for index in numpy.flatnonzero(~shown).tolist():
+            add_point(index, stop_zoom)
+
+    clustered_data = dict(data)
+    clustered_data['features'] = features
+
+    return clustered_data
+
+
+def gaussian_kernel(radius, cell_size):
+    """1D heatmap kernel sampled every cell_size pixels out to radius pixels, as in the GL JS heatmap
+    (a Gaussian with a standard deviation of a third of the radius)
+    """
+    reach = int(radius // cell_size)
+    offsets = numpy.arange(-reach, reach + 1) * cell_size / float(radius)
+    return numpy.exp(-0.5 * 9.0 * offsets ** 2)
+
+
+def convolve_separable(grid, kernel):
+    """Convolve a 2D grid with kernel along both axes, summing shifted copies of the grid"""
+    reach = len(kernel) // 2
+    for axis in (0, 1):
+        padded = numpy.pad(grid, [(reach, reach) if a == axis else (0, 0) for a in (0, 1)], mode='constant')
+        size = grid.shape[axis]
+        grid = sum(weight * numpy.take(padded, numpy.arange(i, i + size), axis=axis)
+                   for i, weight in enumerate(kernel))
+    return grid
+
+
+def density_grid(lon, lat, weights=None, zoom=0, radius=30, intensity=1, max_size=1024, tile_size=512):
+    """Compute a heatmap density grid of weighted points at a zoom level with histogram binning
+    and a Gaussian kernel of radius pixels
+
+    :param lon: array of point longitudes
+    :param lat: array of point latitudes
+    :param weights: array of point weights (default 1)
+    :param radius: heatmap radius in pixels at the zoom level
+    :param intensity: heatmap intensity multiplier
+    :param max_size: maximum number of grid cells along each side; cells are one pixel
+                     unless the data extent is wider than max_size pixels
+
+    Returns the grid of densities (rows from north to south) scaled like the heatmap-density
+    of GL JS, and the image coordinates of its corners (UL, UR, LR, LL) as [lon, lat] pairs.
+    """
+    x, y = mercator_pixels(lon, lat, zoom, tile_size)
+    if weights is None:
+        weights = numpy.ones(len(x))
+
+    x0, y0 = x.min() - radius, y.min() - radius
+    cell_size = max(1.0, max(x.max() + radius - x0, y.max() + radius - y0) / max_size)
+    columns = int(math.ceil((x.max() + radius - x0) / cell_size))
+    rows = int(math.ceil((y.max() + radius - y0) / cell_size))
+    x1, y1 = x0 + columns * cell_size, y0 + rows * cell_size
+
+    histogram, _, _ = numpy.histogram2d(y, x, bins=[rows, columns], range=[[y0, y1], [x0, x1]],
+                                        weights=numpy.nan_to_num(weights))
+    density = convolve_separable(histogram, gaussian_kernel(radius, cell_size))
+    density *= intensity / math.sqrt(2 * math.pi)
+
+    corners_lon, corners_lat = mercator_lnglat([x0, x1, x1, x0], [y0, y0, y1, y1], zoom, tile_size)
+    coordinates = [[float(a), float(b)] for a, b in zip(corners_lon, corners_lat)]
+
+    return density, coordinates
+
+
+def hexagon_cells(x, y, radius):
+    """Axial coordinates (q, r) of the pointy-top hexagons of radius containing projected points"""
+    q = (math.sqrt(3) / 3 * x - y / 3.0) / radius
+    r = (2.0 / 3 * y) / radius
+    s = -q - r
+
+    # round to the nearest hexagon in cube coordinates
+    rq, rr, rs = numpy.rint(q), numpy.rint(r), numpy.rint(s)
+    dq, dr, ds = numpy.abs(rq - q), numpy.abs(rr - r), numpy.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq[fix_q] = -rr[fix_q] - rs[fix_q]
+    rr[fix_r] = -rq[fix_r] - rs[fix_r]
+
+    return rq.astype('int64'), rr.astype('int64')
+
+
+def hexbin(lon, lat, values=None, zoom=0, radius=20, tile_size=512):
+    """Bin points into pointy-top hexagons of radius pixels at a zoom level
+
+    :param lon: array of point longitudes
+    :param lat: array of point latitudes
+    :param values: optional array of point values aggregated over each hexagon (NaN values are ignored)
+
+    Returns a FeatureCollection of hexagon polygons with a `count` property and, with values,
+    `sum` and `mean` properties.
+    """
+    if not len(lon):
+        return {'type': 'FeatureCollection', 'features': []}
+
+    x, y = mercator_pixels(lon, lat, zoom, tile_size)
+    q, r = hexagon_cells(x, y, radius)
+
+    rows = r.max() - r.min() + 1
+    keys, groups, counts = group_keys((q - q.min()) * rows + (r - r.min()))
+    q, r = keys // rows + q.min(), keys % rows + r.min()
+
+    columns = OrderedDict([('count', counts)])
+    if values is not None:
+        values = numpy.asarray(values, dtype='float64')
+        columns['sum'] = aggregate_groups(values, groups, len(counts), 'sum')
+        columns['mean'] = aggregate_groups(values, groups, len(counts), 'mean')
+
+    # hexagon vertices, counterclockwise from the lower right in projected pixels (y points south)
+    angles = numpy.radians(30 - 60 * numpy.arange(7))
+    center_x = radius * math.sqrt(3) * (q + r / 2.0)
+    center_y = radius * 1.5 * r
+    vertex_lon, vertex_lat = mercator_lnglat(center_x[:, None] + radius * numpy.cos(angles),
+                                             center_y[:, None] + radius * numpy.sin(angles),
+                                             zoom, tile_size)
+    rings = numpy.stack([vertex_lon, vertex_lat], axis=-1).tolist()
+
+    columns = OrderedDict((key, column.tolist()) for key, column in columns.items())
+    features = []
+    for i, ring in enumerate(rings):
+        properties = OrderedDict((key, column[i]) for key, column in columns.items())
+        if 'mean' in properties and properties['mean'] != properties['mean']:
+            properties['mean'] = None
+        features.append({'type': 'Feature',
+                         'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+                         'properties': properties})
+
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def thinning_zooms(lon, lat, weights=None, radius=16, maxzoom=14, tile_size=512):
+    """Assign each point the lowest zoom level it is shown from, keeping at most one new point
+    per grid cell of radius pixels at each zoom level
+
+    :param lon: array of point longitudes
+    :param lat: array of point latitudes
+    :param weights: optional array of point priorities; points with higher weights are shown
+                    at lower zoom levels (NaN weights last, ties in data order)
+    :param maxzoom: zoom level all remaining points are shown from
+
+    A point shown at a zoom level stays shown at higher zoom levels and keeps its grid cell,
+    so each zoom level adds points only to cells that are still empty.
+    """
+    count = len(lon)
+    if weights is None:
+        order = numpy.arange(count)
+    else:
+        weights = numpy.asarray(weights, dtype='float64')
+        order = numpy.lexsort((numpy.arange(count), -numpy.where(numpy.isnan(weights), -numpy.inf, weights)))
+
+    # work in priority order so the first point of each cell is the one to show
+    lon = numpy.asarray(lon, dtype='float64')[order]
+    lat = numpy.asarray(lat, dtype='float64')[order]
+    zooms = numpy.full(count, maxzoom, dtype='int64')
+    shown = numpy.zeros(count, dtype=bool)
+
+    for zoom in range(maxzoom):
+        x, y = mercator_pixels(lon, lat, zoom, tile_size)
+        cells = int(math.ceil(tile_size * 2.0 ** zoom / radius)) + 1
+        keys = numpy.floor(x / radius).astype('int64') * cells + numpy.floor(y / radius).astype('int64')
+
+        candidates = numpy.flatnonzero(~shown & ~numpy.isin(keys, keys[shown]))
+        _, first = numpy.unique(keys[candidates], return_index=True)
+        zooms[candidates[first]] = zoom
+        shown[candidates[first]] = True
+        if shown.all():
+            break
+
+    result = numpy.empty(count, dtype='int64')
+    result[order] = zooms
+    return result
+
+
+def filter_bins(values, bins=6):
+    """Bin the values of a feature property for filtering; returns the bin labels and the bin of each value
+
+    Numeric properties are split at quantiles into at most bins ranges, other properties keep one bin for
+    each of their bins - 1 most frequent values and one for all others. Missing values have their own bin.
+    """
+    missing = numpy.array([x is None for x in values], dtype=bool)
+    numeric = all(isinstance(x, (int, float)) and not isinstance(x, bool) for x in values if x is not None)
+
+    if numeric:
+        x = numpy.array([numpy.nan if v is None else v for v in values], dtype='float64').reshape(-1)
+        missing |= numpy.isnan(x)
+        edges = []
+        if (~missing).any():
+            edges = numpy.unique(numpy.quantile(x[~missing], numpy.linspace(0, 1, bins + 1)))
+        if len(edges) > 1:
+            codes = numpy.clip(numpy.searchsorted(edges, x, side='right') - 1, 0, len(edges) - 2)
+            labels = ['{:g} to {:g}'.format(lo, hi) for lo, hi in zip(edges[:-1], edges[1:])]
+        else:
+            codes = numpy.zeros(len(x), dtype='int64')
+            labels = ['{:g}'.format(edge) for edge in edges]
+    else:
+        categories = [x for x, _ in Counter(x for x in values if x is not None).most_common()]
+        other = len(categories) > bins
+        if other:
+            categories = categories[:bins - 1]
+        code = dict((x, i) for i, x in enumerate(categories))
+        codes = numpy.array([code.get(x, len(categories)) for x in values], dtype='int64')
+        labels = [str(x) for x in categories] + (['other'] if other else [])
+
+    if missing.any():
+        codes[missing] = len(labels)
+        labels.append('missing')
+    return labels, codes
+
+
+def bitset_b64(mask):
+    """Pack a boolean array into a little-endian bitset padded to whole 32-bit words, base64-encoded"""
+    # packbits fills bytes from the most significant bit, reversed per byte into little-endian order
+    bits = BIT_REVERSE[numpy.packbits(numpy.asarray(mask, dtype=bool))]
+    bits = numpy.concatenate([bits, numpy.zeros(-len(bits) % 4, dtype='uint8')])
+    return base64.b64encode(bits.tobytes()).decode()
+
+
+def bitmap_index(data, properties, bins=6, tables=None):
+    """Bitmap indexes of feature properties for client-side filtering: one bitset over the features of
+    data per bin of each property (see filter_bins), in which bit i is set for the i-th feature in the bin
+
+    :param data: GeoJSON FeatureCollection
+    :param properties: names of the feature properties to index
+    :param bins: maximum number of bins per property, besides a bin of missing values
+    :param tables: string tables of dictionary encoded properties, used to label categories
+    """
+    dimensions = []
+    for name in properties:
+        values = [(feature.get('properties') or {}).get(name) for feature in data['features']]
+        table = (tables or {}).get(name)
+        if table:
+            values = [table[x] if isinstance(x, int) and 0 <= x < len(table) else x for x in values]
+
+        labels, codes = filter_bins(values, bins)
+        dimensions.append({'property': name,
+                           'labels': labels,
+                           'bitsets': [bitset_b64(codes == b) for b in range(len(labels))]})
+
+    return {'count': len(data['features']), 'dimensions': dimensions}
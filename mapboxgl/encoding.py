@@ -0,0 +1,563 @@
+import base64
+from collections import Counter, OrderedDict
+import json
+import math
+import zlib
+
+import numpy
+
+from .errors import SourceDataError
+from .geometry import shared_arcs
+
+
+DATA_ENCODINGS = ('geojson', 'columnar', 'binary', 'delta', 'topojson')
+
+DATA_COMPRESSIONS = ('gzip',)
+
+INT32_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+try:
+    string_types = (str, unicode)
+    integer_types = (int, long, numpy.integer)
+except NameError:
+    string_types = (str,)
+    integer_types = (int, numpy.integer)
+
+NUMBER_TYPES = integer_types + (float, numpy.floating)
+
+
+def precision_for_zoom(zoom, tile_size=512):
+    """Number of decimal places needed for longitude / latitude values to resolve
+    a single pixel at the given zoom level
+    """
+    degrees_per_pixel = 360.0 / (tile_size * 2 ** zoom)
+    return max(0, int(math.ceil(-math.log10(degrees_per_pixel))))
+
+
+def quantize(values, precision):
+    """Snap coordinate values to a grid of 10 ** -precision degrees; returns the integer grid indices"""
+    return numpy.rint(numpy.asarray(values, dtype='float64') * 10 ** precision).astype('int64')
+
+
+def format_fixed(values, precision, template='{}', separator=','):
+    """Format an array of numbers at fixed precision with a single formatting call;
+    each row of values fills one copy of template, e.g. '[{},{}]' for positions
+    """
+    values = numpy.asarray(values, dtype='float64')
+    rows = values.reshape(-1, values.shape[-1]) if values.ndim > 1 else values.reshape(-1, 1)
+    number = '%.{}f'.format(precision)
+    row = template.format(*([number] * rows.shape[1]))
+    return separator.join([row] * rows.shape[0]) % tuple(rows.ravel())
+
+
+def format_coordinates(coordinates, precision):
+    """Serialize nested GeoJSON coordinates at fixed precision"""
+    if len(coordinates) == 0:
+        return '[]'
+
+    # single position
+    if isinstance(coordinates[0], (int, float)):
+        return format_fixed([coordinates], precision, '[' + ','.join(['{}'] * len(coordinates)) + ']')
+
+    # list of positions (line, ring or multipoint), formatted in bulk
+    if isinstance(coordinates[0][0], (int, float)):
+        try:
+            width = len(coordinates[0])
+            return '[' + format_fixed(coordinates, precision, '[' + ','.join(['{}'] * width) + ']') + ']'
+        except ValueError:
+            # positions with mixed dimensions
+            return '[' + ','.join(format_coordinates(c, precision) for c in coordinates) + ']'
+
+    return '[' + ','.join(format_coordinates(c, precision) for c in coordinates) + ']'
+
+
+def format_geometry(geometry, precision):
+    """Serialize a GeoJSON geometry with coordinates at fixed precision"""
+    if geometry is None:
+        return 'null'
+    if geometry['type'] == 'GeometryCollection':
+        return '{{"type":"GeometryCollection","geometries":[{}]}}'.format(
+            ','.join(format_geometry(g, precision) for g in geometry['geometries']))
+    return '{{"type":"{}","coordinates":{}}}'.format(
+        geometry['type'], format_coordinates(geometry['coordinates'], precision))
+
+
+def iter_geojson(data, precision):
+    """Serialize a GeoJSON FeatureCollection in chunks, writing coordinates at fixed precision
+    instead of full float repr
+    """
+    features = data['features']
+    point_coordinates = None
+
+    # format all 2D point coordinates with one call
+    if features and all((f.get('geometry') or {}).get('type') == 'Point' and
+                        len(f['geometry']['coordinates']) == 2 for f in features):
+        point_coordinates = format_fixed(
+            [f['geometry']['coordinates'] for f in features], precision, '[{},{}]', '\n').split('\n')
+
+    yield '{"type":"FeatureCollection","features":['
+    for i, feature in enumerate(features):
+        if point_coordinates is not None:
+            geometry = '{{"type":"Point","coordinates":{}}}'.format(point_coordinates[i])
+        else:
+            geometry = format_geometry(feature.get('geometry'), precision)
+
+        feature_id = ''
+        if feature.get('id') is not None:
+            feature_id = '"id":{},'.format(json.dumps(feature['id']))
+
+        yield '{}{{"type":"Feature",{}"geometry":{},"properties":{}}}'.format(
+            ',' if i else '',
+            feature_id,
+            geometry,
+            json.dumps(feature.get('properties'), ensure_ascii=False, separators=(',', ':')))
+    yield ']}'
+
+
+def delta_coordinates(coordinates, precision):
+    """Quantize nested GeoJSON coordinates to integers; positions in lines and rings
+    are stored as offsets from the previous position
+    """
+    if len(coordinates) == 0:
+        return coordinates
+
+    if isinstance(coordinates[0], (int, float)):
+        return quantize(coordinates, precision).tolist()
+
+    if isinstance(coordinates[0][0], (int, float)):
+        positions = quantize(coordinates, precision)
+        positions[1:] = numpy.diff(positions, axis=0)
+        return positions.tolist()
+
+    return [delta_coordinates(c, precision) for c in coordinates]
+
+
+def delta_geometry(geometry, precision):
+    if geometry is None:
+        return None
+    if geometry['type'] == 'GeometryCollection':
+        return OrderedDict([
+            ('type', 'GeometryCollection'),
+            ('geometries', [delta_geometry(g, precision) for g in geometry['geometries']])
+        ])
+    return OrderedDict([
+        ('type', geometry['type']),
+        ('coordinates', delta_coordinates(geometry['coordinates'], precision))
+    ])
+
+
+def delta_payload(data, precision=6):
+    """Build a payload of features with quantized, delta-encoded integer coordinates;
+    decoded into GeoJSON by decodeGeoJSON in the viz template
+    """
+    features = []
+    for feature in data['features']:
+        encoded = OrderedDict([
+            ('type', 'Feature'),
+            ('geometry', delta_geometry(feature.get('geometry'), precision)),
+            ('properties', feature.get('properties'))
+        ])
+        if feature.get('id') is not None:
+            encoded['id'] = feature['id']
+        features.append(encoded)
+
+    return OrderedDict([
+        ('encoding', 'delta'),
+        ('precision', precision),
+        ('features', features)
+    ])
+
+
+def topology_geometry(geometry, references, precision):
+    """Replace the lines and rings of a geometry with the next arc references from the iterator
+    references; other geometries keep delta-encoded coordinates
+    """
+    if geometry is None:
+        return None
+    if geometry['type'] == 'GeometryCollection':
+        return OrderedDict([
+            ('type', 'GeometryCollection'),
+            ('geometries', [topology_geometry(g, references, precision) for g in geometry['geometries']])
+        ])
+
+    if geometry['type'] == 'LineString':
+        arcs = next(references)
+    elif geometry['type'] in ('MultiLineString', 'Polygon'):
+        arcs = [next(references) for _ in geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        arcs = [[next(references) for _ in polygon] for polygon in geometry['coordinates']]
+    else:
+        return delta_geometry(geometry, precision)
+
+    return OrderedDict([('type', geometry['type']), ('arcs', arcs)])
+
+
+def topology_payload(data, precision=6):
+    """Build a payload storing the borders shared by lines and polygons once, as TopoJSON arcs of
+    quantized, delta-encoded [lon, lat] positions referenced by the feature geometries;
+    decoded into GeoJSON by decodeGeoJSON in the viz template
+    """
+    arcs, references = shared_arcs(data)
+
+    # quantize all arcs at once; the first position of each arc is absolute, the others are offsets
+    encoded_arcs = []
+    if arcs:
+        positions = quantize(numpy.concatenate(arcs), precision)
+        starts = numpy.cumsum([0] + [len(arc) for arc in arcs[:-1]])
+        offsets = positions.copy()
+        offsets[1:] -= positions[:-1]
+        offsets[starts] = positions[starts]
+        encoded_arcs = [arc.tolist() for arc in numpy.split(offsets, starts[1:])]
+
+    references = iter(references)
+    features = []
+    for feature in data['features']:
+        encoded = OrderedDict([
+            ('type', 'Feature'),
+            ('geometry', topology_geometry(feature.get('geometry'), references, precision)),
+            ('properties', feature.get('properties'))
+        ])
+        if feature.get('id') is not None:
+            encoded['id'] = feature['id']
+        features.append(encoded)
+
+    return OrderedDict([
+        ('encoding', 'topojson'),
+        ('precision', precision),
+        ('arcs', encoded_arcs),
+        ('features', features)
+    ])
+
+
+def select_properties(data, properties):
+    """Project a GeoJSON FeatureCollection down to the given feature properties;
+    returns a new FeatureCollection, data is left unchanged
+    """
+    keep = set(properties)
+
+    features = []
+    for feature in data['features']:
+        selected = dict(feature)
+        selected['properties'] = OrderedDict(
+            (key, value) for key, value in (feature.get('properties') or {}).items() if key in keep)
+        features.append(selected)
+
+    selected_data = dict(data)
+    selected_data['features'] = features
+
+    return selected_data
+
+
+def add_properties(data, columns):
+    """Add properties to each feature from lists of values indexed by feature position;
+    returns a new FeatureCollection, data is left unchanged
+    """
+    features = []
+    for i, feature in enumerate(data['features']):
+        extended = dict(feature)
+        extended['properties'] = OrderedDict(feature.get('properties') or {})
+        for key, values in columns.items():
+            extended['properties'][key] = values[i]
+        features.append(extended)
+
+    extended_data = dict(data)
+    extended_data['features'] = features
+
+    return extended_data
+
+
+def split_properties(data, properties):
+    """Split feature properties between a new FeatureCollection keeping the given properties
+    and a table of all other properties with one list of values per property,
+    indexed by feature position (the feature id generated by the GeoJSON source)
+    """
+    keep = set(properties)
+
+    keys = OrderedDict()
+    for feature in data['features']:
+        for key in (feature.get('properties') or {}):
+            if key not in keep:
+                keys[key] = None
+
+    table = OrderedDict(
+        (key, [(f.get('properties') or {}).get(key) for f in data['features']]) for key in keys)
+
+    return select_properties(data, properties), table
+
+
+def categorical_properties(data, max_ratio=0.5, properties=None, exclude=()):
+    """Find string properties with few distinct values; returns a dict of property name to
+    list of categories ordered from most to least frequent
+
+    If properties are given, only those are returned, with any value type and no limit
+    on the number of distinct values. Properties in exclude are never returned.
+    """
+    counts = OrderedDict()
+    excluded = set(exclude)
+    total = 0
+
+    for feature in data['features']:
+        total += 1
+        for key, value in (feature.get('properties') or {}).items():
+            if value is None or key in excluded:
+                continue
+            if properties is not None:
+                if key not in properties or isinstance(value, (dict, list)):
+                    continue
+            elif not isinstance(value, string_types):
+                excluded.add(key)
+                counts.pop(key, None)
+                continue
+            counts.setdefault(key, Counter())[value] += 1
+
+    return OrderedDict(
+        (key, [x for x, _ in counter.most_common()]) for key, counter in counts.items()
+        if properties is not None or len(counter) <= max_ratio * total)
+
+
+def dictionary_encode(data, max_ratio=0.5, properties=None, exclude=()):
+    """Replace values of low-cardinality string properties with integer codes
+
+    :param data: GeoJSON FeatureCollection
+    :param max_ratio: maximum ratio of distinct values to features for a property to be encoded
+    :param properties: encode these properties as dense category indices regardless of type and cardinality
+    :param exclude: properties kept as they are, e.g. read directly by layer styles
+
+    Returns a new FeatureCollection and a dict of property name to string table,
+    in which a feature's code is the index of its value (most frequent value first)
+    """
+    tables = categorical_properties(data, max_ratio, properties, exclude)
+    codes = dict((key, dict((x, i) for i, x in enumerate(table))) for key, table in tables.items())
+
+    features = []
+    for feature in data['features']:
+        encoded = dict(feature)
+        encoded['properties'] = OrderedDict(
+            (key, codes[key].get(value) if key in codes else value)
+            for key, value in (feature.get('properties') or {}).items())
+        features.append(encoded)
+
+    encoded_data = dict(data)
+    encoded_data['features'] = features
+
+    return encoded_data, tables
+
+
+def geojson_to_columns(data):
+    """Split a GeoJSON FeatureCollection of points into a flat coordinates list
+    and one list of values per feature property
+    """
+    features = data['features']
+
+    # collect property names in order of first appearance
+    keys = OrderedDict()
+    for feature in features:
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') != 'Point':
+            raise SourceDataError('Columnar data encoding requires GeoJSON Point features, '
+                                  'found {}.'.format(geometry.get('type')))
+        for key in (feature.get('properties') or {}):
+            keys[key] = None
+
+    coordinates = [c for f in features for c in f['geometry']['coordinates'][:2]]
+    rows = [f.get('properties') or {} for f in features]
+    properties = OrderedDict((key, [row.get(key) for row in rows]) for key in keys)
+
+    return coordinates, properties
+
+
+def feature_ids(data):
+    """List of feature ids, or None if the source data does not define them"""
+    ids = [f.get('id') for f in data['features']]
+    if any(x is not None for x in ids):
+        return ids
+
+
+def columnar_payload(data, precision=None):
+    """Build a columnar payload from a GeoJSON FeatureCollection of points;
+    decoded into features by decodeGeoJSON in the viz template
+    """
+    coordinates, properties = geojson_to_columns(data)
+    if precision is not None:
+        coordinates = numpy.round(coordinates, precision).tolist()
+    payload = OrderedDict([
+        ('encoding', 'columnar'),
+        ('coordinates', coordinates),
+        ('properties', properties)
+    ])
+
+    ids = feature_ids(data)
+    if ids:
+        payload['ids'] = ids
+
+    return payload
+
+
+def typed_array_b64(values, dtype):
+    """Pack an array-like into a little-endian buffer of dtype ('<f4', '<f8', '<i4'), base64-encoded"""
+    return base64.b64encode(numpy.ascontiguousarray(values, dtype=dtype).tobytes()).decode()
+
+
+def frames_payload(values):
+    """Pack a matrix of feature values per animation frame (frames x features) as a Float32 buffer;
+    missing values carry the value of the previous frame forward
+    """
+    values = numpy.asarray(values, dtype='float64')
+    if values.ndim != 2:
+        raise ValueError('frame values must be a 2-dimensional array of frames x features')
+
+    # index of the last frame with a value, per frame and feature
+    last = numpy.where(numpy.isnan(values), 0, numpy.arange(len(values))[:, None])
+    numpy.maximum.accumulate(last, axis=0, out=last)
+    filled = values[last, numpy.arange(values.shape[1])]
+
+    return {'frames': values.shape[0], 'features': values.shape[1], 'values': typed_array_b64(filled, '<f4')}
+
+
+def binary_column(values):
+    """Encode a property column as an Int32/Float64 typed array if all values are numeric,
+    otherwise keep it as a JSON list
+    """
+    # check the value types once per type, not per value
+    types = set(map(type, values))
+    missing = type(None) in types
+    types.discard(type(None))
+    if not all(issubclass(t, NUMBER_TYPES) and not issubclass(t, bool) for t in types):
+        return OrderedDict([('type', 'json'), ('data', values)])
+
+    if not missing and all(issubclass(t, integer_types) for t in types):
+        array = numpy.asarray(values, dtype='int64')
+        if not len(array) or INT32_RANGE[0] <= array.min() and array.max() <= INT32_RANGE[1]:
+            return OrderedDict([('type', 'int32'), ('data', base64.b64encode(array.astype('<i4').tobytes()).decode())])
+
+    # missing values are packed as NaN and decoded back to null
+    array = numpy.asarray(values, dtype='float64')
+    return OrderedDict([('type', 'float64'), ('data', base64.b64encode(array.astype('<f8').tobytes()).decode())])
+
+
+def binary_payload(data, precision=None):
+    """Build a binary payload from a GeoJSON FeatureCollection of points; coordinates are packed
+    as a Float32 buffer and numeric properties as Int32 / Float64 buffers, all base64-encoded
+    """
+    coordinates, properties = geojson_to_columns(data)
+    coordinates = numpy.asarray(coordinates, dtype='float64')
+    if precision is not None:
+        coordinates = numpy.round(coordinates, precision)
+    payload = OrderedDict([
+        ('encoding', 'binary'),
+        ('count', len(data['features'])),
+        ('coordinates', base64.b64encode(coordinates.astype('<f4').tobytes()).decode()),
+        ('properties', OrderedDict((key, binary_column(values)) for key, values in properties.items()))
+    ])
+
+    ids = feature_ids(data)
+    if ids:
+        payload['ids'] = ids
+
+    return payload
+
+
+def payload_object(data, encoding='geojson', precision=None):
+    """Build the JSON-serializable payload for data in the given encoding"""
+    if encoding not in DATA_ENCODINGS:
+        raise ValueError('data_encoding must be one of {}'.format(', '.join(DATA_ENCODINGS)))
+
+    if encoding == 'binary':
+        return binary_payload(data, precision)
+    elif encoding == 'columnar':
+        return columnar_payload(data, precision)
+    elif encoding == 'delta':
+        return delta_payload(data, 6 if precision is None else precision)
+    elif encoding == 'topojson':
+        return topology_payload(data, 6 if precision is None else precision)
+    return data
+
+
+def payload_chunks(data, encoding='geojson', precision=None):
+    """Serialize the payload for data in the given encoding to an iterable of JSON text chunks"""
+    if encoding == 'geojson' and precision is not None:
+        return iter_geojson(data, precision)
+
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    return encoder.iterencode(payload_object(data, encoding, precision))
+
+
+def encode_payload(data, encoding='geojson', precision=None):
+    """Serialize viz data to the JavaScript expression used as the template GeoJSON source data
+
+    :param data: GeoJSON FeatureCollection (or a URL / filename string passed through as is)
+    :param encoding: one of 'geojson', 'columnar', 'binary', 'delta' or 'topojson'
+    :param precision: number of decimal places kept for coordinates; None keeps full precision
+    """
+    # URLs and filenames are fetched by Mapbox GL JS directly
+    if not isinstance(data, dict):
+        return json.dumps(data, ensure_ascii=False)
+
+    if encoding == 'geojson':
+        if precision is None:
+            return json.dumps(data, ensure_ascii=False)
+        return ''.join(iter_geojson(data, precision))
+
+    return 'decodeGeoJSON({})'.format(''.join(payload_chunks(data, encoding, precision)))
+
+
+def gzip_chunks(chunks, compression_level=6, buffer_size=2 ** 16):
+    """Gzip-compress an iterable of text chunks without holding the uncompressed text in memory;
+    returns the compressed bytes and the number of uncompressed bytes
+    """
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    compressed = []
+    buffered = []
+    buffered_size = 0
+    raw_size = 0
+
+    for chunk in chunks:
+        buffered.append(chunk)
+        buffered_size += len(chunk)
+
+        # feed the compressor in large blocks, JSONEncoder.iterencode yields very small chunks
+        if buffered_size >= buffer_size:
+            block = ''.join(buffered).encode('utf-8')
+            raw_size += len(block)
+            compressed.append(compressor.compress(block))
+            buffered, buffered_size = [], 0
+
+    block = ''.join(buffered).encode('utf-8')
+    raw_size += len(block)
+    compressed.append(compressor.compress(block))
+    compressed.append(compressor.flush())
+
+    return b''.join(compressed), raw_size
+
+
+def compress_payload(data, encoding='geojson', compression='gzip', compression_level=6, source_id='data',
+                     precision=None):
+    """Serialize viz data to a gzip-compressed, base64-encoded payload inflated in the browser
+    with DecompressionStream and set on the template GeoJSON source once decoded
+
+    :param data: GeoJSON FeatureCollection (or a URL / filename string passed through as is)
+    :param encoding: one of 'geojson', 'columnar' or 'binary'
+    :param compression: compression format, only 'gzip' is supported
+    :param compression_level: zlib compression level from 1 (fastest) to 9 (smallest)
+    :param source_id: id of the template GeoJSON source updated with the inflated data
+    :param precision: number of decimal places kept for coordinates; None keeps full precision
+
+    Returns the JavaScript expression for the template and a dict of compression statistics
+    (uncompressed and compressed size in bytes, compression ratio)
+    """
+    if compression not in DATA_COMPRESSIONS:
+        raise ValueError('data_compression must be one of {}'.format(', '.join(DATA_COMPRESSIONS)))
+
+    if not isinstance(data, dict):
+        return json.dumps(data, ensure_ascii=False), None
+
+    compressed, raw_size = gzip_chunks(payload_chunks(data, encoding, precision), compression_level)
+
+    stats = {
+        'raw_bytes': raw_size,
+        'compressed_bytes': len(compressed),
+        'ratio': round(float(raw_size) / max(len(compressed), 1), 2)
+    }
+    js = "inflateGeoJSON('{}', '{}')".format(source_id, base64.b64encode(compressed).decode())
+
+    return js, stats
@@ -0,0 +1,385 @@
+import numpy
+
+from .aggregate import mercator_pixels, mercator_lnglat
+
+
+def geometry_lines(geometry):
+    """List (positions, is_ring) of the lines and polygon rings of a GeoJSON geometry in coordinate order"""
+    geometry_type = (geometry or {}).get('type')
+    coordinates = (geometry or {}).get('coordinates')
+    if geometry_type == 'LineString':
+        return [(coordinates, False)]
+    if geometry_type == 'MultiLineString':
+        return [(line, False) for line in coordinates]
+    if geometry_type == 'Polygon':
+        return [(ring, True) for ring in coordinates]
+    if geometry_type == 'MultiPolygon':
+        return [(ring, True) for polygon in coordinates for ring in polygon]
+    if geometry_type == 'GeometryCollection':
+        return [line for part in geometry['geometries'] for line in geometry_lines(part)]
+    return []
+
+
+def replace_lines(geometry, lines):
+    """Copy of a GeoJSON geometry with its lines and rings taken in order from the iterator lines"""
+    geometry_type = (geometry or {}).get('type')
+    if geometry_type not in ('LineString', 'MultiLineString', 'Polygon', 'MultiPolygon', 'GeometryCollection'):
+        return geometry
+
+    replaced = dict(geometry)
+    if geometry_type == 'LineString':
+        replaced['coordinates'] = next(lines)
+    elif geometry_type in ('MultiLineString', 'Polygon'):
+        replaced['coordinates'] = [next(lines) for _ in geometry['coordinates']]
+    elif geometry_type == 'MultiPolygon':
+        replaced['coordinates'] = [[next(lines) for _ in polygon] for polygon in geometry['coordinates']]
+    else:
+        replaced['geometries'] = [replace_lines(part, lines) for part in geometry['geometries']]
+    return replaced
+
+
+def open_positions(positions, ring):
+    """Positions of a line, without the closing position of a ring"""
+    if ring and len(positions) > 1 and positions[0] == positions[-1]:
+        return positions[:-1]
+    return positions
+
+
+def line_signatures(lines, rings):
+    """Concatenated [lon, lat] vertices of lines with signatures of the sets of lines sharing each vertex
+    and each edge (from a vertex to the next one, wrapping around rings)
+
+    Each line is given a random weight and a signature is the sum of the weights of the distinct lines
+    a vertex or edge appears in, so vertices and edges shared by the same lines have equal signatures.
+    """
+    arrays = [numpy.array([p[:2] for p in positions], dtype='float64').reshape(-1, 2) for positions in lines]
+    sizes = [len(array) for array in arrays]
+    coordinates = numpy.concatenate(arrays) if arrays else numpy.zeros((0, 2))
+    if not len(coordinates):
+        return coordinates, numpy.zeros(0), numpy.zeros(0), sizes
+
+    line_ids = numpy.repeat(numpy.arange(len(arrays)), sizes)
+    _, vertex = numpy.unique(coordinates, axis=0, return_inverse=True)
+    vertex = vertex.ravel()
+
+    # index of the next vertex of each vertex; the last vertex of an open line points to itself
+    ends = numpy.cumsum(sizes)
+    following = numpy.arange(len(vertex)) + 1
+    following[ends - 1] = numpy.where(rings, ends - numpy.array(sizes), ends - 1)
+    low, high = numpy.minimum(vertex, vertex[following]), numpy.maximum(vertex, vertex[following])
+    _, edge = numpy.unique(low * (vertex.max() + 1) + high, return_inverse=True)
+    edge = edge.ravel()
+
+    weights = numpy.random.RandomState(0).random_sample(len(arrays))
+
+    def signatures(keys):
+        pairs = numpy.unique(keys * len(arrays) + line_ids)
+        return numpy.bincount(pairs // len(arrays), weights=weights[pairs % len(arrays)],
+                              minlength=keys.max() + 1)[keys]
+
+    return coordinates, signatures(vertex), signatures(edge), sizes
+
+
+def junctions(points, vertex_signatures, edge_signatures, ring):
+    """Indices of the vertices of a line that must be kept so that shared borders simplify alike:
+    line ends and vertices shared by other lines than their edges are, where a shared border starts
+    or ends. A ring without junctions keeps its lowest vertex, so the same ring in other features
+    starts at the same vertex.
+    """
+    previous = numpy.roll(edge_signatures, 1)
+    locked = (vertex_signatures != previous) | (vertex_signatures != edge_signatures)
+    if not ring:
+        locked[[0, -1]] = True
+
+    indices = numpy.flatnonzero(locked)
+    if not len(indices):
+        indices = numpy.lexsort((points[:, 1], points[:, 0]))[:1]
+    return indices
+
+
+def douglas_peucker(points, tolerance):
+    """Boolean mask of the points of a line kept by Douglas-Peucker simplification within tolerance"""
+    keep = numpy.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+
+        start, direction = points[first], points[last] - points[first]
+        segment = points[first + 1:last] - start
+        length = direction.dot(direction)
+        if length > 0:
+            segment = segment - numpy.clip(segment.dot(direction) / length, 0, 1)[:, None] * direction
+        distances = (segment ** 2).sum(axis=1)
+
+        farthest = int(numpy.argmax(distances))
+        if distances[farthest] > tolerance ** 2:
+            index = first + 1 + farthest
+            keep[index] = True
+            stack.extend([(first, index), (index, last)])
+
+    return keep
+
+
+def chain_reversed(points):
+    """Whether a chain is processed reversed, so that it starts at its lower end; chains shared
+    by several lines then run in the same direction whichever line they are taken from
+    """
+    head, tail = tuple(points[0]), tuple(points[-1])
+    return tail < head or (tail == head and len(points) > 2 and tuple(points[-2]) < tuple(points[1]))
+
+
+def line_chains(points, vertex_signatures, edge_signatures, ring):
+    """Split a line or open ring at its junctions; yields the vertex indices of each chain,
+    the chains of a ring wrap around to its first junction
+    """
+    locks = junctions(points, vertex_signatures, edge_signatures, ring)
+    ends = numpy.append(locks, locks[0] + len(points)) if ring else locks
+
+    for first, last in zip(ends[:-1], ends[1:]):
+        yield numpy.arange(first, last + 1) % len(points)
+
+
+def simplify_line(points, vertex_signatures, edge_signatures, ring, tolerance):
+    """Boolean mask of the vertices of a line or open ring kept by topology-preserving simplification
+
+    The line is split into chains at its junctions and each chain is simplified on its own in
+    a canonical direction, so a border shared by several lines is simplified identically in each.
+    """
+    keep = numpy.zeros(len(points), dtype=bool)
+    for chain in line_chains(points, vertex_signatures, edge_signatures, ring):
+        if chain_reversed(points[chain]):
+            chain = chain[::-1]
+        keep[chain[douglas_peucker(points[chain], tolerance)]] = True
+
+    return keep
+
+
+def shared_arcs(data):
+    """Split the lines and polygon rings of a FeatureCollection into arcs stored once however many
+    features share them, as in TopoJSON
+
+    Returns the list of arcs as arrays of [lon, lat] positions and, for each line or ring in the order
+    of geometry_lines, the list of its arc references: the arc index, or its one's complement (~index)
+    for an arc traversed in reverse. Consecutive arcs of a line share their end position.
+    """
+    lines = [line for feature in data['features'] for line in geometry_lines(feature.get('geometry'))]
+    coordinates, vertex_signatures, edge_signatures, sizes = line_signatures(
+        [open_positions(positions, ring) for positions, ring in lines], [ring for _, ring in lines])
+
+    arcs, index, references = [], {}, []
+    offset = 0
+    for (_, ring), size in zip(lines, sizes):
+        part = slice(offset, offset + size)
+        offset += size
+        points = coordinates[part]
+        chains = line_chains(points, vertex_signatures[part], edge_signatures[part], ring) if size else []
+
+        line_references = []
+        for chain in chains:
+            chain_points = points[chain]
+            reverse = chain_reversed(chain_points)
+            if reverse:
+                chain_points = chain_points[::-1]
+
+            key = chain_points.tobytes()
+            if key not in index:
+                index[key] = len(arcs)
+                arcs.append(chain_points)
+            line_references.append(~index[key] if reverse else index[key])
+        references.append(line_references)
+
+    return arcs, references
+
+
+def simplify_geometries(data, tolerance=0.375, zoom=14, tile_size=512):
+    """Simplify the lines and polygon rings of a FeatureCollection with Douglas-Peucker in Web Mercator
+    pixels at a zoom level, preserving the borders shared between polygons and lines
+
+    :param data: GeoJSON FeatureCollection
+    :param tolerance: maximum distance in pixels between a removed vertex and the simplified line
+    :param zoom: zoom level the tolerance applies at; geometry drawn at lower zoom levels is coarser
+
+    Vertices shared by the same set of lines keep matching after simplification, so neighbouring
+    polygons do not open gaps or overlaps along their common borders. Rings that would collapse
+    to fewer than three vertices are kept unchanged. Returns a new FeatureCollection.
+    """
+    lines = [line for feature in data['features'] for line in geometry_lines(feature.get('geometry'))]
+    coordinates, vertex_signatures, edge_signatures, sizes = line_signatures(
+        [open_positions(positions, ring) for positions, ring in lines], [ring for _, ring in lines])
+    x, y = mercator_pixels(coordinates[:, 0], coordinates[:, 1], zoom, tile_size)
+    projected = numpy.column_stack([x, y])
+
+    simplified = []
+    offset = 0
+    for (positions, ring), size in zip(lines, sizes):
+        part = slice(offset, offset + size)
+        offset += size
+        if size < (4 if ring else 3):
+            simplified.append(positions)
+            continue
+
+        keep = simplify_line(projected[part], vertex_signatures[part], edge_signatures[part], ring, tolerance)
+        indices = numpy.flatnonzero(keep).tolist()
+        if ring and len(indices) < 3:
+            simplified.append(positions)
+        elif ring:
+            simplified.append([positions[i] for i in indices] + [positions[indices[0]]])
+        else:
+            simplified.append([positions[i] for i in indices])
+
+    lines = iter(simplified)
+    features = []
+    for feature in data['features']:
+        feature = dict(feature)
+        feature['geometry'] = replace_lines(feature.get('geometry'), lines)
+        features.append(feature)
+
+    simplified_data = dict(data)
+    simplified_data['features'] = features
+
+    return simplified_data
+
+
+def geometry_positions(geometry):
+    """List the [lon, lat] of all positions of a GeoJSON geometry"""
+    if not geometry:
+        return []
+    if geometry['type'] == 'GeometryCollection':
+        return [p for part in geometry['geometries'] for p in geometry_positions(part)]
+
+    coordinates = geometry['coordinates']
+    if geometry['type'] == 'Point':
+        return [coordinates[:2]]
+    if geometry['type'] in ('MultiPoint', 'LineString'):
+        return [p[:2] for p in coordinates]
+    return [p[:2] for line, _ in geometry_lines(geometry) for p in line]
+
+
+def feature_bounds(data):
+    """Array of the [west, south, east, north] bounds of each feature of a FeatureCollection;
+    NaN for features without coordinates
+    """
+    positions, counts = [], []
+    for feature in data['features']:
+        feature_positions = geometry_positions(feature.get('geometry'))
+        positions.extend(feature_positions)
+        counts.append(len(feature_positions))
+
+    # reduce the positions of all features at once
+    bounds = numpy.full((len(counts), 4), numpy.nan)
+    counts = numpy.array(counts, dtype='int64')
+    filled = counts > 0
+    if filled.any():
+        positions = numpy.array(positions, dtype='float64').reshape(-1, 2)
+        starts = (numpy.cumsum(counts) - counts)[filled]
+        bounds[filled] = numpy.hstack([numpy.minimum.reduceat(positions, starts),
+                                       numpy.maximum.reduceat(positions, starts)])
+    return bounds
+
+
+def hilbert_index(x, y, bits=16):
+    """Distance along a Hilbert curve of integer grid coordinates in [0, 2 ** bits)"""
+    x, y = numpy.asarray(x, dtype='int64'), numpy.asarray(y, dtype='int64')
+    distance = numpy.zeros(len(x), dtype='int64')
+    side = 1 << bits
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        distance += s * s * ((3 * rx) ^ ry)
+
+        # rotate the quadrant so the curve continues in the same orientation
+        flip = ~ry & rx
+        x, y = numpy.where(flip, side - 1 - x, x), numpy.where(flip, side - 1 - y, y)
+        x, y = numpy.where(ry, x, y), numpy.where(ry, y, x)
+        s >>= 1
+    return distance
+
+
+def view_bounds(center, zoom, width, height, margin=0.5, tile_size=512):
+    """[west, south, east, north] of a map view of width x height pixels at center (lon, lat) and zoom,
+    widened on each side by margin times the view size
+    """
+    x, y = mercator_pixels([center[0]], [center[1]], zoom, tile_size)
+    half_width, half_height = width * (0.5 + margin), height * (0.5 + margin)
+    lon, lat = mercator_lnglat([x[0] - half_width, x[0] + half_width], [y[0] + half_height, y[0] - half_height],
+                               zoom, tile_size)
+
+    # views wider than the world include all longitudes
+    if lon[1] - lon[0] >= 360:
+        return [-180.0, float(lat[0]), 180.0, float(lat[1])]
+    west, east = (float(a + 180) % 360 - 180 for a in lon)
+    return [west, float(lat[0]), east, float(lat[1])]
+
+
+def tile_bounds(x, y, z, tile_size=512):
+    """[west, south, east, north] of the web map tile z/x/y"""
+    lon, lat = mercator_lnglat([x * tile_size, (x + 1) * tile_size], [(y + 1) * tile_size, y * tile_size],
+                               z, tile_size)
+    return [float(lon[0]), float(lat[0]), float(lon[1]), float(lat[1])]
+
+
+class SpatialIndex(object):
+    """Packed Hilbert R-tree over the bounding boxes of features or points for fast bounding box queries
+
+    :param data: GeoJSON FeatureCollection, or pandas DataFrame of points with lat and lon columns
+    :param lat: name of the latitude column of a DataFrame
+    :param lon: name of the longitude column of a DataFrame
+    :param node_size: number of boxes per tree node
+
+    Boxes are sorted along a Hilbert curve of their centers and packed into nodes of node_size
+    boxes, each level stored as a NumPy array of node bounds. Queries descend one level at a time.
+    """
+
+    def __init__(self, data, lat='lat', lon='lon', node_size=16):
+        if isinstance(data, dict):
+            boxes = feature_bounds(data)
+        else:
+            x, y = numpy.asarray(data[lon], dtype='float64'), numpy.asarray(data[lat], dtype='float64')
+            boxes = numpy.column_stack([x, y, x, y])
+
+        self.size = len(boxes)
+        self.node_size = node_size
+
+        valid = numpy.flatnonzero(~numpy.isnan(boxes).any(axis=1))
+        boxes = boxes[valid]
+        if len(boxes):
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+            low, extent = centers.min(axis=0), numpy.ptp(centers, axis=0)
+            grid = (centers - low) / numpy.where(extent > 0, extent, 1) * (2 ** 16 - 1)
+            order = numpy.argsort(hilbert_index(grid[:, 0], grid[:, 1]), kind='stable')
+            valid, boxes = valid[order], boxes[order]
+
+        # leaf level first; each parent node bounds node_size consecutive children
+        self.ids = valid
+        self.levels = [boxes]
+        while len(self.levels[-1]) > node_size:
+            children = self.levels[-1]
+            starts = numpy.arange(0, len(children), node_size)
+            self.levels.append(numpy.column_stack([numpy.minimum.reduceat(children[:, 0], starts),
+                                                   numpy.minimum.reduceat(children[:, 1], starts),
+                                                   numpy.maximum.reduceat(children[:, 2], starts),
+                                                   numpy.maximum.reduceat(children[:, 3], starts)]))
+
+    def query(self, bounds):
+        """Sorted positions of the features intersecting bounds [west, south, east, north];
+        bounds with west > east cross the antimeridian
+        """
+        west, south, east, north = bounds
+        if west > east:
+            return numpy.union1d(self.query([west, south, 180, north]), self.query([-180, south, east, north]))
+
+        nodes = numpy.arange(len(self.levels[-1]))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[depth][nodes]
+            nodes = nodes[(boxes[:, 0] <= east) & (boxes[:, 2] >= west) &
+                          (boxes[:, 1] <= north) & (boxes[:, 3] >= south)]
+            if depth:
+                nodes = (nodes[:, None] * self.node_size + numpy.arange(self.node_size)).ravel()
+                nodes = nodes[nodes < len(self.levels[depth - 1])]
+
+        return numpy.sort(self.ids[nodes])
@@ -0,0 +1,181 @@
+"""Live updates of displayed maps over a Jupyter comm channel.
+
+A map shown with live=True opens a comm to the kernel with target COMM_TARGET once it has loaded,
+identified by the key of its viz. Messages sent before the map is connected are queued and delivered
+when the comm opens, so updates can be pushed right after show().
+"""
+import json
+
+import numpy
+
+from mapboxgl.encoding import iter_geojson, payload_object
+
+
+COMM_TARGET = 'mapboxgl'
+
+_connections = {}
+_target_registered = False
+
+
+def payload_text(data, encoding='geojson', precision=None):
+    """JSON text of the payload for data in the given encoding, encoded in one pass"""
+    if encoding == 'geojson' and precision is not None:
+        return ''.join(iter_geojson(data, precision))
+    return json.dumps(payload_object(data, encoding, precision), ensure_ascii=False, separators=(',', ':'))
+
+
+def data_message(data, encoding='geojson', precision=None, property_tables=None, keys=None, source='data'):
+    """Message replacing the data of a GeoJSON map source
+
+    :param data: GeoJSON FeatureCollection
+    :param encoding: data encoding of the payload, decoded by the map like the embedded data
+    :param precision: number of decimal places kept for coordinates; None keeps full precision
+    :param property_tables: string tables of dictionary encoded properties
+    :param keys: key of each feature, kept by the map to apply later patch messages
+    :param source: id of the map source
+    """
+    message = {'method': 'setData',
+               'source': source,
+               'data': payload_text(data, encoding, precision),
+               'propertyTables': property_tables or {}}
+    if keys is not None:
+        message['keys'] = keys
+    return message
+
+
+def patch_message(data, keys, removed, encoding='geojson', precision=None, source='data'):
+    """Message adding or replacing the features of data (with the given keys) in a map source
+    set with keys, and removing the features with the removed keys
+    """
+    return {'method': 'patch',
+            'source': source,
+            'data': payload_text(data, encoding, precision),
+            'keys': keys,
+            'remove': removed}
+
+
+def paint_message(layer, name, value):
+    """Message setting the paint property name of a map layer to value"""
+    return {'method': 'setPaintProperty', 'layer': layer, 'name': name, 'value': value}
+
+
+def row_hashes(data, key):
+    """Keys and 64-bit content hashes of the rows of a pandas DataFrame, or the features of a GeoJSON
+    FeatureCollection, identified by the key column or property; DataFrames are hashed vectorized
+    """
+    if isinstance(data, dict):
+        keys = numpy.array([(feature.get('properties') or {}).get(key) for feature in data['features']])
+        hashes = numpy.array([hash(json.dumps(feature, sort_keys=True, default=str)) for feature in data['features']],
+                             dtype='int64')
+        return keys, hashes
+
+    import pandas
+    return data[key].values, pandas.util.hash_pandas_object(data, index=False).values.view('int64')
+
+
+def has_duplicates(keys):
+    """Whether an array of keys holds any value more than once"""
+    keys = numpy.asarray(keys)
+    if keys.dtype.kind in 'biufSU':
+        return len(numpy.unique(keys)) < len(keys)
+    return len(set(keys.tolist())) < len(keys)
+
+
+def match_keys(previous, keys):
+    """Position of each of keys in the array previous, -1 for keys not in previous"""
+    previous, keys = numpy.asarray(previous), numpy.asarray(keys)
+    if len(previous) == 0:
+        return numpy.full(len(keys), -1, dtype='int64')
+
+    if previous.dtype.kind in 'biuf' and keys.dtype.kind in 'biuf':
+        order = numpy.argsort(previous, kind='mergesort')
+        ordered = previous[order]
+        positions = numpy.minimum(numpy.searchsorted(ordered, keys), len(ordered) - 1)
+        return numpy.where(ordered[positions] == keys, order[positions], -1)
+
+    index = dict(zip(previous.tolist(), range(len(previous))))
+    return numpy.array([index.get(k, -1) for k in keys.tolist()], dtype='int64')
+
+
+def diff_rows(previous_keys, previous_hashes, keys, hashes):
+    """Compare rows to a previous snapshot of them by key and content hash
+
+    Returns the position of each row in the previous snapshot (-1 for new rows), the positions of
+    the added and modified rows, and the keys of the previous rows that were removed
+    """
+    positions = match_keys(previous_keys, keys)
+    matched = positions >= 0
+    changed = ~matched
+    changed[matched] = numpy.asarray(previous_hashes)[positions[matched]] != numpy.asarray(hashes)[matched]
+
+    kept = numpy.zeros(len(previous_keys), dtype=bool)
+    kept[positions[matched]] = True
+    return positions, numpy.flatnonzero(changed), numpy.asarray(previous_keys)[~kept]
+
+
+class LiveConnection(object):
+    """Channel of update messages to the map of one viz"""
+
+    def __init__(self, key):
+        self.key = key
+        self.comm = None
+        self.pending = []
+
+    @property
+    def connected(self):
+        return self.comm is not None
+
+    def send(self, message):
+        """Send message to the map, or queue it until the map is connected; replacing the data of
+        a source drops the queued messages for that source
+        """
+        if self.comm is not None:
+            self.comm.send(message)
+            return
+
+        if message['method'] == 'setData':
+            self.pending = [m for m in self.pending if m.get('source') != message['source']]
+        self.pending.append(message)
+
+    def open(self, comm):
+        """Deliver queued and later messages over comm until it is closed"""
+        self.comm = comm
+        comm.on_close(lambda msg: self.close(comm))
+        pending, self.pending = self.pending, []
+        for message in pending:
+            comm.send(message)
+
+    def close(self, comm=None):
+        if comm is None or comm is self.comm:
+            self.comm = None
+
+
+def get_comm_manager():
+    """Comm manager of the running kernel"""
+    try:
+        from comm import get_comm_manager
+    except ImportError:
+        from IPython import get_ipython
+        shell = get_ipython()
+        if shell is None or not hasattr(shell, 'kernel'):
+            raise RuntimeError('live maps must be shown in a Jupyter kernel')
+        return shell.kernel.comm_manager
+    return get_comm_manager()
+
+
+def handle_comm_open(comm, msg):
+    """Comm target handler connecting a map to the connection with its key"""
+    connection = _connections.get(msg['content']['data'].get('key'))
+    if connection is None:
+        comm.close()
+    else:
+        connection.open(comm)
+
+
+def register_connection(connection):
+    """Route the comm opened by the map with the key of connection to it"""
+    global _target_registered
+    if not _target_registered:
+        get_comm_manager().register_target(COMM_TARGET, handle_comm_open)
+        _target_registered = True
+    _connections[connection.key] = connection
@@ -0,0 +1,146 @@
+import json
+import re
+import threading
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import numpy
+
+from .aggregate import thinning_zooms
+from .encoding import payload_chunks
+from .geometry import SpatialIndex, feature_bounds, tile_bounds
+
+
+TILE_PATH = re.compile(r'^/data/(\w+)/(\d+)/(\d+)/(\d+)\.json$')
+
+# zoom level from which maps request tiles of the highest zoom level; all features are served from it
+TILE_MAXZOOM = 14
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class DataRequestHandler(BaseHTTPRequestHandler):
+    """Answer GET /data/<key>/<z>/<x>/<y>.json with the features of a dataset in a web map tile"""
+
+    def do_GET(self):
+        match = TILE_PATH.match(self.path.split('?')[0])
+        chunk = None
+        if match:
+            key, z, x, y = match.group(1), int(match.group(2)), int(match.group(3)), int(match.group(4))
+            chunk = self.server.data_server.chunk(key, x, y, z)
+
+        if chunk is None:
+            self.send_error(404)
+            return
+
+        body = chunk.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        # maps are displayed in sandboxed iframes
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DataServer(object):
+    """Local HTTP server answering map viewport requests with the features of each tile,
+    so that large datasets are loaded as the map moves instead of embedded in the map HTML
+
+    :param host: interface to listen on
+    :param port: port to listen on; 0 picks a free port
+    :param thinning_radius: points are thinned to at most one new point per grid cell of thinning_radius
+                            pixels at each zoom level below TILE_MAXZOOM, so that tiles at low zoom levels
+                            hold an evenly spread subset of the points; 0 serves all points at all zoom levels
+    :param max_tile_features: maximum number of features of a tile, keeping those served from the lowest
+                              zoom levels
+
+    The server runs in a daemon thread from construction until shutdown.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, thinning_radius=16, max_tile_features=20000):
+        self.datasets = {}
+        self.thinning_radius = thinning_radius
+        self.max_tile_features = max_tile_features
+        self.httpd = ThreadingServer((host, port), DataRequestHandler)
+        self.httpd.data_server = self
+        self.host, self.port = self.httpd.server_address[:2]
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    def add(self, data, encoding='geojson', precision=None, key=None):
+        """Serve a GeoJSON FeatureCollection, replacing any dataset with the same key;
+        returns the URL of its tiles (without the /z/x/y.json suffix)
+        """
+        key = key or uuid.uuid4().hex
+        self.datasets[key] = (SpatialIndex(data), data, encoding, precision, self.feature_zooms(data))
+        return '{}/data/{}'.format(self.url, key)
+
+    def feature_zooms(self, data):
+        """Lowest zoom level each feature of a FeatureCollection is served from: points are thinned
+        on a grid of thinning_radius pixels, other geometries are served at all zoom levels
+        """
+        boxes = feature_bounds(data)
+        zooms = numpy.zeros(len(boxes), dtype='int64')
+        valid = ~numpy.isnan(boxes).any(axis=1)
+        if self.thinning_radius and valid.any() and (boxes[valid, :2] == boxes[valid, 2:]).all():
+            zooms[valid] = thinning_zooms(boxes[valid, 0], boxes[valid, 1], radius=self.thinning_radius,
+                                          maxzoom=TILE_MAXZOOM)
+        return zooms
+
+    def remove(self, key):
+        self.datasets.pop(key, None)
+
+    def chunk(self, key, x, y, z):
+        """JSON of the features of a dataset intersecting tile z/x/y and served at zoom level z: their
+        positions in the dataset (`index`) and the payload in the dataset encoding (`data`), decoded by
+        decodeGeoJSON; None for unknown datasets
+        """
+        if key not in self.datasets:
+            return None
+
+        index, data, encoding, precision, zooms = self.datasets[key]
+        positions = index.query(tile_bounds(x, y, z))
+        positions = positions[zooms[positions] <= z]
+        if len(positions) > self.max_tile_features:
+            kept = numpy.argsort(zooms[positions], kind='stable')[:self.max_tile_features]
+            positions = positions[numpy.sort(kept)]
+
+        positions = positions.tolist()
+        subset = dict(data)
+        subset['features'] = [data['features'][i] for i in positions]
+
+        return '{{"index":{},"data":{}}}'.format(json.dumps(positions),
+                                                  ''.join(payload_chunks(subset, encoding, precision)))
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+default_server = None
+
+
+def get_default_server():
+    """Data server shared by the maps created with data_server=True, started on first use"""
+    global default_server
+    if default_server is None:
+        default_server = DataServer()
+    return default_server
@@ -8,6 +8,7 @@ from chroma import Color, Scale
 from colour import Color as Colour
 import geojson
 from matplotlib.image import imsave
+import numpy
 import requests
 
 from .colors import color_ramps, common_html_colors
@@ -44,6 +45,8 @@ def df_to_geojson(df, properties=None, lat='lat', lon='lon', precision=6, date_f
     # convert dates/datetimes to preferred string format if specified
     df = convert_date_columns(df, date_format)
 
+    features = df_to_features(df, properties, lat, lon, precision, date_format)
+
     if filename:
         with open(filename, 'w') as f:
             # Overwrite file if it already exists
@@ -53,12 +56,11 @@ def df_to_geojson(df, properties=None, lat='lat', lon='lon', precision=6, date_f
 
             # Write out file to line
             f.write('{"type": "FeatureCollection", "features": [\n')
-            # Iterate over enumerated iterrows as index from iterrows alone could be non-sequential
-            for i, (index, row) in enumerate(df[[lon, lat] + properties].iterrows()):
+            for i, feature in enumerate(features):
                 if i == 0:
-                    f.write(geojson.dumps(row_to_geojson(row, lon, lat, precision, date_format)) + '\n')
+                    f.write(geojson.dumps(feature) + '\n')
                 else:
-                    f.write(',' + geojson.dumps(row_to_geojson(row, lon, lat, precision, date_format)) + '\n')
+                    f.write(',' + geojson.dumps(feature) + '\n')
             f.write(']}')
 
             return {
@@ -67,10 +69,22 @@ def df_to_geojson(df, properties=None, lat='lat', lon='lon', precision=6, date_f
                 "feature_count": df.shape[0]
             }
     else:
-        features = []
-        df[[lon, lat] + properties].apply(lambda x: features.append(
-            row_to_geojson(x, lon, lat, precision, date_format)), axis=1)
-        return geojson.FeatureCollection(features)
+        return geojson.FeatureCollection(list(features))
+
+
+def df_to_features(df, properties, lat='lat', lon='lon', precision=6, date_format='epoch'):
+    """Generate geojson Point features from a Pandas dataframe, rounding coordinates
+    and serializing properties for all rows at once rather than row by row
+    """
+    coordinates = df[[lon, lat]].values.astype('float64')
+    if precision is not None:
+        coordinates = numpy.round(coordinates, precision)
+
+    # Let pandas handle json serialization
+    records = json.loads(df[properties].to_json(orient='records', date_format=date_format, date_unit='s'))
+
+    for (x, y), row_properties in zip(coordinates.tolist(), records):
+        yield geojson.Feature(geometry=geojson.Point((x, y)), properties=row_properties)
 
 
 def geojson_to_dict_list(data):
@@ -114,6 +128,25 @@ def gdf_to_geojson(gdf, date_format='epoch', properties=None, filename=None):
         return json.loads(geojson_str)
 
 
+def frame_matrix(df, keys, key='id', time='time', value='value'):
+    """Pivot long-format readings with one row per feature and time to a matrix of one row per
+    time (in time order) and one column per feature (in the order of keys), for frame_values;
+    returns the sorted times and the matrix, NaN where a feature has no reading at a time
+    """
+    times, frames = numpy.unique(df[time].values, return_inverse=True)
+
+    keys = numpy.asarray(keys)
+    order = numpy.argsort(keys, kind='mergesort')
+    ordered = keys[order]
+    row_keys = df[key].values
+    positions = numpy.minimum(numpy.searchsorted(ordered, row_keys), len(keys) - 1)
+    found = ordered[positions] == row_keys
+
+    matrix = numpy.full((len(times), len(keys)), numpy.nan)
+    matrix[frames[found], order[positions[found]]] = numpy.asarray(df[value].values, dtype='float64')[found]
+    return times, matrix
+
+
 def convert_date_columns(df, date_format='epoch'):
     """Convert dates/datetimes to preferred string format if specified
         i.e. '%Y-%m-%d', 'epoch', 'iso'
@@ -380,6 +413,68 @@ def numeric_map(lookup, numeric_stops, default=0.0):
     return default
 
 
+def numeric_lookup_array(values):
+    """Return a float array of lookup values with NaN for missing or non-numeric values"""
+    return numpy.array([x if isinstance(x, (int, float)) and not isinstance(x, bool) else numpy.nan
+                        for x in values], dtype=float)
+
+
+def color_ramp(values, color_stops):
+    """Return an array of (r, g, b, alpha) rows for an array of numbers, linearly interpolated
+    in rgb space from numeric color_stops and clamped to the outer stops; alpha is 0 to 1
+    """
+    stops, colors = zip(*sorted(color_stops))
+    rgba = numpy.array([(rgb_tuple_from_str(x) + (1.0,))[:4] for x in colors], dtype=float)
+    values = numpy.asarray(values, dtype=float)
+    return numpy.column_stack([numpy.interp(values, stops, rgba[:, i]) for i in range(4)])
+
+
+def color_map_array(values, color_stops, default_color='rgb(122,122,122)', function_type='interpolate'):
+    """Return a list of colors for an array of lookup values, matched or linearly
+    interpolated (in rgb space, clamped to the outer stops) from given color_stops
+    """
+    values = list(values)
+    if not color_stops:
+        return [default_color] * len(values)
+
+    if function_type == 'match':
+        match_map = dict((x, y) for (x, y) in color_stops)
+        return [match_map.get(x, default_color) for x in values]
+
+    lookup = numeric_lookup_array(values)
+    missing = numpy.isnan(lookup)
+    channels = color_ramp(lookup, color_stops)
+    channels[missing] = 0
+
+    if (channels[~missing, 3] == 1).all():
+        template = '#{:02x}{:02x}{:02x}'
+        channels = numpy.rint(channels[:, :3]).astype(int).tolist()
+    else:
+        template = 'rgba({},{},{},{:.3g})'
+        channels = [[int(round(r)), int(round(g)), int(round(b)), a] for r, g, b, a in channels.tolist()]
+
+    return [default_color if missing[i] else template.format(*channel) for i, channel in enumerate(channels)]
+
+
+def numeric_map_array(values, numeric_stops, default=0.0, function_type='interpolate', decimals=2):
+    """Return a list of numbers for an array of lookup values, matched or linearly
+    interpolated (clamped to the outer stops) from given numeric_stops
+    """
+    values = list(values)
+    if not numeric_stops:
+        return [default] * len(values)
+
+    if function_type == 'match':
+        match_map = dict((x, y) for (x, y) in numeric_stops)
+        return [match_map.get(x, default) for x in values]
+
+    stops, results = zip(*sorted(numeric_stops))
+    lookup = numeric_lookup_array(values)
+    mapped = numpy.round(numpy.interp(lookup, stops, results), decimals)
+
+    return numpy.where(numpy.isnan(lookup), default, mapped).tolist()
+
+
 def img_encode(arr, **kwargs):
     """Encode ndarray to base64 string image data
     
@@ -1,6 +1,10 @@
+import base64
 import codecs
 import json
+import math
 import os
+import uuid
+from collections import Counter, OrderedDict
 
 from IPython.core.display import HTML, display
 
@@ -8,11 +12,20 @@ import numpy
 import requests
 
 from mapboxgl.errors import TokenError, LegendError
-from mapboxgl.utils import color_map, numeric_map, img_encode, geojson_to_dict_list
+from mapboxgl.utils import (color_map, numeric_map, color_map_array, numeric_map_array, color_ramp, img_encode,
+                            geojson_to_dict_list, create_color_stops, df_to_geojson)
+from mapboxgl.encoding import (encode_payload, compress_payload, precision_for_zoom, dictionary_encode,
+                               select_properties, split_properties, add_properties, payload_chunks, frames_payload)
+from mapboxgl.aggregate import (cluster_points, density_grid, hexbin, point_coordinates, property_values,
+                                thinning_zooms, bitmap_index)
+from mapboxgl.geometry import simplify_geometries, view_bounds, feature_bounds, SpatialIndex
+from mapboxgl.server import get_default_server
+from mapboxgl.live import (LiveConnection, data_message, patch_message, paint_message, register_connection,
+                           row_hashes, diff_rows, has_duplicates)
 from mapboxgl import templates
 
 
-GL_JS_VERSION = 'v1.5.0'
+GL_JS_VERSION = 'v1.13.0'
 
 
 class VectorMixin(object):
@@ -72,6 +85,50 @@ class VectorMixin(object):
             self.vector_source = False
 
 
+class ThinningMixin(object):
+
+    def thin_points(self):
+        """Whether points are assigned a minimum zoom level for thinning (GeoJSON data only)"""
+        return bool(self.thinning_radius) and not self.vector_source and isinstance(self.data, dict)
+
+    def styling_properties(self):
+        """List the feature properties referenced by the layer styles and thinning filter"""
+        properties = super(ThinningMixin, self).styling_properties()
+        if self.thin_points():
+            properties.append('lod_zoom')
+        return properties
+
+    def source_data(self):
+        """Add the zoom level each point is shown from as property `lod_zoom` with thinning_radius,
+        so that low zoom levels draw an evenly spread subset of the points
+        """
+        if not self.thin_points():
+            return self.data
+
+        lon, lat = point_coordinates(self.data)
+        weights = property_values(self.data, self.thinning_property) if self.thinning_property else None
+        zooms = thinning_zooms(lon, lat, weights, radius=self.thinning_radius, maxzoom=self.thinning_maxzoom)
+
+        return add_properties(self.data, {'lod_zoom': zooms.tolist()})
+
+
+class SimplifyMixin(object):
+
+    def source_maxzoom(self):
+        """Highest zoom level the GeoJSON source is tiled at; higher zoom levels scale its tiles"""
+        return max(0, min(14, int(math.ceil(self.max_zoom))))
+
+    def source_data(self):
+        """Simplify lines and polygon rings with simplify_geometry to the source tolerance at the source
+        maxzoom, the finest detail the map draws; lower zoom levels are simplified further by GL JS
+        """
+        data = super(SimplifyMixin, self).source_data()
+        if not (self.simplify_geometry and isinstance(data, dict)):
+            return data
+
+        return simplify_geometries(data, tolerance=self.source_tolerance, zoom=self.source_maxzoom())
+
+
 class MapViz(object):
 
     def __init__(self,
@@ -122,7 +179,30 @@ class MapViz(object):
                  scale_background_color='white',
                  scale_text_color='#131516',
                  popup_open_action='hover',
-                 add_snapshot_links=False):
+                 add_snapshot_links=False,
+                 data_encoding='geojson',
+                 data_compression=None,
+                 compression_level=6,
+                 coordinate_precision=None,
+                 dictionary_encoding=False,
+                 popup_properties=None,
+                 popup_table=False,
+                 vector_join_mode='match',
+                 category_indexing=False,
+                 legend_max_categories=None,
+                 bounds=None,
+                 bounds_margin=0.5,
+                 data_server=None,
+                 progressive=False,
+                 progressive_sample=10000,
+                 worker_parsing=False,
+                 live=False,
+                 frame_values=None,
+                 frame_labels=None,
+                 frame_property=None,
+                 frame_interval=500,
+                 filter_properties=None,
+                 filter_bins=6):
         """Construct a MapViz object
 
         :param data: GeoJSON Feature Collection
@@ -171,6 +251,43 @@ class MapViz(object):
         :param scale_text_color: text color the scale annotation
         :param popup_open_action: controls behavior of opening and closing feature popups; one of 'hover' or 'click'
         :param add_snapshot_links: boolean switch for adding buttons to download screen captures of map or legend
+        :param data_encoding: format of the data embedded in the map HTML; one of 'geojson', 'columnar', 'binary' (point data only), 'delta' or 'topojson' (shared borders stored once)
+        :param data_compression: compress the data embedded in the map HTML; None or 'gzip' (inflated by the browser)
+        :param compression_level: zlib compression level from 1 (fastest) to 9 (smallest) used with data_compression
+        :param coordinate_precision: decimal places kept for embedded coordinates; 'auto' resolves a pixel at max_zoom, None keeps full precision
+        :param dictionary_encoding: boolean to embed low-cardinality string properties as integer codes plus a string table
+        :param popup_properties: list of properties shown in feature popups; if set, only these and the properties used
+                                 for styling and labels are embedded in the map HTML (default None shows all properties)
+        :param popup_table: boolean to keep only styling properties in the map source; other popup properties are
+                            embedded as a separate table looked up by feature id when a popup opens
+        :param vector_join_mode: how join data styles vector features; 'match' builds match expressions and filters
+                                 over every join key, 'feature-state' sets the join data as feature state so the
+                                 style size does not grow with the join data (not supported by HeatmapViz)
+        :param category_indexing: boolean to embed properties styled with match functions as dense integer category
+                                  indices (most frequent first), styled with one array lookup instead of a match branch
+                                  per category
+        :param legend_max_categories: number of categories listed in match color legends, most frequent first
+                                      (default None lists all color stops)
+        :param bounds: embed only the features intersecting [west, south, east, north], or the starting view of
+                       the map with 'view' (default None embeds all features)
+        :param bounds_margin: with bounds='view', fraction of the view width and height added on each side
+        :param data_server: serve the data from a local mapboxgl.server.DataServer (True for a shared server) instead
+                            of embedding it; the map loads the features of the tiles in view as it moves
+        :param progressive: boolean to embed a spatially even sample of progressive_sample features in the map source
+                            and append the other features in chunks decoded while the browser is idle
+        :param progressive_sample: number of features shown on first paint with progressive
+        :param worker_parsing: boolean to embed the data in a script block that is not executed, parsed and decoded
+                               off the main thread by a web worker (compressed data is already inflated asynchronously)
+        :param live: boolean to keep the map shown in a Jupyter notebook connected to the kernel, so that
+                     update_data and set_paint_property update it without rendering it again
+        :param frame_values: matrix of frames x features (e.g. from mapboxgl.utils.frame_matrix) of the values of
+                             frame_property per animation frame, shown one frame at a time with a slider
+        :param frame_labels: label of each frame, such as the time of its values (default frame numbers)
+        :param frame_property: feature property animated with frame_values (default color_property)
+        :param frame_interval: milliseconds per frame when playing the animation
+        :param filter_properties: feature properties shown as filters on the map, applied client-side with
+                                  bitmap indexes of the features in each bin of each property
+        :param filter_bins: maximum number of bins per filter property (quantile ranges or most frequent values)
 
         """
         if access_token is None:
@@ -232,6 +349,34 @@ class MapViz(object):
         self.legend_key_borders_on = legend_key_borders_on
         self.popup_open_action = popup_open_action
         self.add_snapshot_links = add_snapshot_links
+        self.data_encoding = data_encoding
+        self.data_compression = data_compression
+        self.compression_level = compression_level
+        self.compression_stats = None
+        self.coordinate_precision = coordinate_precision
+        self.dictionary_encoding = dictionary_encoding
+        self.popup_properties = popup_properties
+        self.popup_table = popup_table
+        self.vector_join_mode = vector_join_mode
+        self.category_indexing = category_indexing
+        self.legend_max_categories = legend_max_categories
+        self.bounds = bounds
+        self.bounds_margin = bounds_margin
+        self.spatial_index = None
+        self.data_server = data_server
+        self.data_key = uuid.uuid4().hex
+        self.progressive = progressive
+        self.progressive_sample = progressive_sample
+        self.worker_parsing = worker_parsing
+        self.live = live
+        self.connection = LiveConnection(self.data_key) if live else None
+        self.data_snapshot = None
+        self.frame_values = frame_values
+        self.frame_labels = frame_labels
+        self.frame_property = frame_property
+        self.frame_interval = frame_interval
+        self.filter_properties = filter_properties
+        self.filter_bins = filter_bins
 
         # scale configuration
         self.scale = scale
@@ -257,12 +402,374 @@ class MapViz(object):
         html = self.create_html(**kwargs)
         map_html = self.as_iframe(html)
 
+        # Route the updates of live maps to the comm opened by the map
+        if self.connection is not None:
+            register_connection(self.connection)
+
         # Display the iframe in the current jupyter notebook view
         display(HTML(map_html))
 
+    def update_data(self, data, key=None, lat='lat', lon='lon'):
+        """Replace the viz data and send it to the map shown with live, which updates its source in place
+
+        :param data: GeoJSON FeatureCollection, or pandas DataFrame of points with lat and lon columns
+        :param key: property (or DataFrame column) uniquely identifying features across updates; rows are
+                    compared to the previous update by key and content hash and only the added, modified
+                    and removed features are sent
+        :param lat: name of the latitude column of a DataFrame
+        :param lon: name of the longitude column of a DataFrame
+        """
+        if self.connection is None:
+            raise ValueError('update_data requires a viz created with live=True')
+        # the map styles and labels look up encoded properties in the string tables embedded with the map
+        if self.vector_source or self.category_indexing or self.dictionary_encoding:
+            raise ValueError('update_data does not support vector sources, category_indexing or dictionary_encoding')
+        # served tiles, frame values and filter bitsets are indexed by the features the map was created with
+        if self.data_server or self.frame_values is not None or self.filter_properties:
+            raise ValueError('update_data does not support data_server, frame_values or filter_properties')
+
+        if key is not None:
+            keys, hashes = row_hashes(data, key)
+            if has_duplicates(keys):
+                raise ValueError('update_data key {} must be unique, found duplicate values'.format(key))
+
+        # features can be patched when the map source holds exactly the features of self.data, in order
+        snapshot = self.data_snapshot
+        if snapshot is not None and key == snapshot[0]:
+            positions, changed, removed = diff_rows(snapshot[1], snapshot[2], keys, hashes)
+            self.data = self.merge_rows(data, positions, changed, lat, lon)
+            self.data_snapshot = (key, keys, hashes)
+            if not (len(changed) or len(removed)):
+                return
+
+            updated = dict(self.data, features=[self.data['features'][i] for i in changed.tolist()])
+            updated, precision = self.prepare_source_data(updated, {}, split_popups=False)
+            self.connection.send(patch_message(updated, keys[changed].tolist(), removed.tolist(),
+                                               self.data_encoding, precision))
+            return
+
+        self.data = data if isinstance(data, dict) else df_to_geojson(data, lat=lat, lon=lon)
+        self.spatial_index = None
+        self.data_snapshot = None
+
+        options = {}
+        source = self.source_data()
+        source_data, precision = self.prepare_source_data(source, options, split_popups=False)
+
+        patchable = key is not None and source is self.data and self.bounds is None and not self.progressive
+        if patchable:
+            self.data_snapshot = (key, keys, hashes)
+        self.connection.send(data_message(source_data, self.data_encoding, precision,
+                                          property_tables=json.loads(options['propertyTables']),
+                                          keys=keys.tolist() if patchable else None))
+
+    def merge_rows(self, data, positions, changed, lat='lat', lon='lon'):
+        """FeatureCollection of the rows of data, reusing the features of self.data for unchanged rows
+        (at positions in self.data) and converting only the changed rows of a DataFrame
+        """
+        if isinstance(data, dict):
+            return data
+
+        previous = self.data['features']
+        features = [previous[i] if i >= 0 else None for i in positions.tolist()]
+        converted = df_to_geojson(data.iloc[changed], lat=lat, lon=lon)['features']
+        for i, feature in zip(changed.tolist(), converted):
+            features[i] = feature
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def set_paint_property(self, layer, name, value):
+        """Set a paint property of a map layer shown with live, e.g. ('circle', 'circle-opacity', 0.5)"""
+        if self.connection is None:
+            raise ValueError('set_paint_property requires a viz created with live=True')
+        self.connection.send(paint_message(layer, name, value))
+
     def add_unique_template_variables(self, options):
         pass
 
+    def styling_properties(self):
+        """List the feature properties referenced by the viz style, labels and filters"""
+        properties = []
+        for style in ['color', 'radius', 'weight', 'height', 'line_width', 'label']:
+            name = getattr(self, '{}_property'.format(style), None)
+            if name and name not in properties:
+                properties.append(name)
+        properties += [name for name in self.filter_properties or [] if name not in properties]
+        return properties + ['_' + style for style, _, _, _, _ in self.baked_styles()]
+
+    def baked_styles(self):
+        """List (style, property, function type, stops, default) of the data-driven styles
+        precomputed per feature when bake_style is set
+        """
+        if not getattr(self, 'bake_style', False):
+            return []
+
+        styles = []
+        for style in ['color', 'radius', 'height']:
+            name = getattr(self, '{}_property'.format(style), None)
+            stops = getattr(self, '{}_stops'.format(style), None)
+            if name and stops:
+                styles.append((style, name, getattr(self, '{}_function_type'.format(style)),
+                               stops, getattr(self, '{}_default'.format(style))))
+        return styles
+
+    def bake_style_properties(self, data):
+        """Add the final color and size of each feature as properties `_color`, `_radius` and `_height`;
+        returns the new FeatureCollection and a dict of style name to property
+        """
+        columns = OrderedDict()
+        for style, name, function_type, stops, default in self.baked_styles():
+            values = [(feature.get('properties') or {}).get(name) for feature in data['features']]
+            style_map = color_map_array if style == 'color' else numeric_map_array
+            columns['_' + style] = style_map(values, stops, default, function_type)
+
+        return add_properties(data, columns), OrderedDict((key[1:], key) for key in columns)
+
+    def match_properties(self):
+        """List the feature properties styled with match functions"""
+        properties = []
+        for style in ['color', 'radius', 'height', 'line_width']:
+            name = getattr(self, '{}_property'.format(style), None)
+            if name and getattr(self, '{}_function_type'.format(style), None) == 'match' and name not in properties:
+                properties.append(name)
+        return properties
+
+    def legend_color_stops(self, color_stops):
+        """Color stops listed in the legend; match legends with legend_max_categories
+        list only the most frequent categories in the data
+        """
+        if not (self.legend_max_categories and color_stops) or getattr(self, 'color_function_type', None) != 'match':
+            return color_stops
+
+        if isinstance(self.data, dict):
+            rows = [feature.get('properties') or {} for feature in self.data['features']]
+        elif isinstance(self.data, list):
+            rows = self.data
+        else:
+            rows = []
+        counts = Counter(row.get(self.color_property) for row in rows)
+
+        return sorted(color_stops, key=lambda stop: -counts[stop[0]])[:self.legend_max_categories]
+
+    def source_data(self):
+        """GeoJSON data of the map source before encoding"""
+        return self.data
+
+    def split_source_data(self, data, precision, options):
+        """GeoJSON data of the map source after preparation, for features embedded separately"""
+        return data
+
+    def view_size(self):
+        """Width and height in pixels of the map div; sizes not given in pixels default to 1000 x 500"""
+        size = []
+        for value, default in [(self.width, 1000), (self.height, 500)]:
+            value = str(value)
+            size.append(float(value[:-2]) if value.endswith('px') else default)
+        return size
+
+    def query_bounds(self):
+        """[west, south, east, north] of the features to embed with bounds"""
+        if self.bounds == 'view':
+            width, height = self.view_size()
+            return view_bounds(self.center, self.zoom, width, height, self.bounds_margin)
+        return list(self.bounds)
+
+    def bounds_subset(self, data):
+        """Features of data intersecting bounds, found with a spatial index built once over self.data"""
+        if self.bounds is None or not isinstance(data, dict):
+            return data
+
+        if data is not self.data:
+            index = SpatialIndex(data)
+        else:
+            if self.spatial_index is None:
+                self.spatial_index = SpatialIndex(data)
+            index = self.spatial_index
+
+        subset = dict(data)
+        subset['features'] = [data['features'][i] for i in index.query(self.query_bounds()).tolist()]
+        return subset
+
+    def progressive_order(self, data):
+        """Reorder features so that every leading slice of them is spread evenly over the map: features are
+        sorted by the zoom level they are shown from when thinned on a grid (see thinning_zooms)
+        """
+        bounds = feature_bounds(data)
+        centers = numpy.nan_to_num((bounds[:, :2] + bounds[:, 2:]) / 2)
+        order = numpy.argsort(thinning_zooms(centers[:, 0], centers[:, 1]), kind='stable')
+
+        ordered = dict(data)
+        ordered['features'] = [data['features'][i] for i in order.tolist()]
+        return ordered
+
+    def progressive_chunks(self, data):
+        """Split features into the initial sample of progressive_sample features and chunks
+        of the remaining features, each chunk twice the size of the previous one
+        """
+        features = data['features']
+        size = self.progressive_sample
+        parts = [features[:size]]
+        start = size
+        while start < len(features):
+            size *= 2
+            parts.append(features[start:start + size])
+            start += size
+
+        return [dict(data, features=part) for part in parts]
+
+    def prepare_source_data(self, data, options, split_popups=True):
+        """Subset, style, prune and dictionary encode the GeoJSON source data, updating the template variables
+        for property tables, baked styles and the popup table (with split_popups); returns the data and the
+        coordinate precision it is encoded with
+        """
+        # keep only the features around the region shown
+        data = self.bounds_subset(data)
+
+        # spatially even ordering, so the sample embedded for the first paint covers the whole map
+        if self.progressive and isinstance(data, dict):
+            data = self.progressive_order(data)
+
+        # precompute data-driven styles so layer paint only reads one property per style
+        style_properties = {}
+        if self.baked_styles() and isinstance(data, dict):
+            data, style_properties = self.bake_style_properties(data)
+            options.update(styleProperties=json.dumps(style_properties))
+
+        # drop properties that are neither styled nor shown in popups
+        if self.popup_properties is not None and isinstance(data, dict):
+            data = select_properties(data, self.styling_properties() + list(self.popup_properties))
+
+        # move popup-only properties out of the map source into a table indexed by feature id
+        if self.popup_table and split_popups and isinstance(data, dict):
+            data, table = split_properties(data, self.styling_properties())
+            options.update(popupTable=json.dumps(table, ensure_ascii=False).replace('</', '<\\/'))
+
+        # replace categories of match-styled properties with dense indices into one table per property
+        tables = OrderedDict()
+        if self.category_indexing and isinstance(data, dict):
+            data, tables = dictionary_encode(data, properties=self.match_properties())
+
+        # replace repeated category strings with integer codes into one string table per property;
+        # the layer paint reads baked colors as they are
+        if self.dictionary_encoding and isinstance(data, dict):
+            data, string_tables = dictionary_encode(data, exclude=list(style_properties.values()))
+            tables.update(string_tables)
+
+        options.update(propertyTables=json.dumps(tables, ensure_ascii=False))
+
+        # delta and topojson encodings always quantize coordinates
+        precision = self.coordinate_precision
+        if precision == 'auto' or (precision is None and self.data_encoding in ('delta', 'topojson')):
+            precision = precision_for_zoom(self.max_zoom)
+
+        return data, precision
+
+    def add_frame_template_variables(self, data, options):
+        """Embed frame_values for animation, set as feature state by generated feature id (the position of
+        each feature in the source); the animated property of each feature is set to its first frame value
+        """
+        if self.bounds is not None or self.progressive or self.data_server or not isinstance(data, dict):
+            raise ValueError('frame_values require GeoJSON source data without bounds, progressive or data_server')
+
+        payload = frames_payload(self.frame_values)
+        if payload['features'] != len(data['features']):
+            raise ValueError('frame_values must have one column per feature, found {} columns for {} features'.format(
+                payload['features'], len(data['features'])))
+
+        labels = self.frame_labels if self.frame_labels is not None else range(payload['frames'])
+        labels = numpy.asarray(labels)
+        if labels.dtype.kind == 'M':
+            labels = numpy.char.replace(numpy.datetime_as_string(labels, unit='m'), 'T', ' ')
+
+        labels = json.dumps([str(x) for x in labels.tolist()], ensure_ascii=False)
+
+        # layers with baked styles read precomputed properties instead of the animated one
+        prop = self.frame_property or getattr(self, 'color_property', None)
+        if prop is None:
+            raise ValueError('frame_values require a frame_property or color_property to animate')
+        if prop in [style[1] for style in self.baked_styles()]:
+            raise ValueError('frame_property {} cannot be animated with bake_style'.format(prop))
+
+        first = numpy.asarray(self.frame_values, dtype='float64')[0]
+        options.update(frameValues=json.dumps(payload),
+                       frameLabels=labels.replace('</', '<\\/'),
+                       frameProperty=prop,
+                       frameInterval=self.frame_interval)
+        return add_properties(data, {prop: [None if numpy.isnan(x) else x for x in first.tolist()]})
+
+    def add_filter_template_variables(self, data, options):
+        """Embed bitmap indexes of filter_properties over the features of the map source, by generated
+        feature id (the position of each feature in the source)
+        """
+        if self.data_server or not isinstance(data, dict):
+            raise ValueError('filter_properties require GeoJSON source data without data_server')
+
+        index = bitmap_index(data, self.filter_properties, self.filter_bins,
+                             tables=json.loads(options['propertyTables']))
+        options.update(filterIndex=json.dumps(index, ensure_ascii=False).replace('</', '<\\/'))
+
+    def add_data_template_variables(self, options):
+        """Update map template variables for the embedded GeoJSON source data"""
+        options.update(propertyTables=json.dumps({}), popupTable=None, styleProperties=json.dumps({}), dataUrl=None,
+                       dataChunks=[], sourceData=None, frameValues=None, filterIndex=None, clusterPoints=None)
+
+        if self.vector_source:
+            options.update(geojson_data=json.dumps(self.data, ensure_ascii=False))
+            return
+
+        # progressive chunks are appended to a source filled from plain embedded data
+        if self.progressive and (self.worker_parsing or self.data_compression):
+            raise ValueError('progressive cannot be combined with worker_parsing or data_compression')
+
+        data = self.source_data()
+        if self.frame_values is not None:
+            data = self.add_frame_template_variables(data, options)
+
+        # served data is loaded in chunks, so feature ids do not match positions in a popup table
+        data, precision = self.prepare_source_data(data, options, split_popups=not self.data_server)
+
+        if self.filter_properties:
+            self.add_filter_template_variables(data, options)
+
+        data = self.split_source_data(data, precision, options)
+
+        # the map source starts empty and is filled with the tiles in view requested from the server
+        if self.data_server and isinstance(data, dict) and data['features']:
+            server = get_default_server() if self.data_server is True else self.data_server
+            options.update(dataUrl=server.add(data, self.data_encoding, precision, key=self.data_key),
+                           geojson_data=json.dumps({'type': 'FeatureCollection', 'features': []}))
+            return
+
+        # embed the sample in the map source and the remaining chunks as script blocks decoded later
+        # (not compressed, the sample must be in the source when the chunks are appended)
+        if self.progressive and isinstance(data, dict) and len(data['features']) > self.progressive_sample:
+            parts = self.progressive_chunks(data)
+            options.update(geojson_data=encode_payload(parts[0], self.data_encoding, precision),
+                           dataChunks=[encode_payload(chunk, self.data_encoding, precision).replace('</', '<\\/')
+                                       for chunk in parts[1:]])
+            return
+
+        # the map source starts empty and is set once a web worker has parsed the embedded payload
+        if self.worker_parsing and not self.data_compression and isinstance(data, dict):
+            # base64 survives the quote swap of as_iframe, which breaks JSON strings
+            payload = ''.join(payload_chunks(data, self.data_encoding, precision))
+            encoded = self.data_encoding != 'geojson'
+            options.update(sourceData=base64.b64encode(payload.encode('utf-8')).decode(),
+                           geojson_data="loadWorkerData('data', 'source-data', {})".format(
+                               'true' if encoded else 'false'))
+            return
+
+        # record the achieved compression in self.compression_stats
+        if self.data_compression:
+            payload, self.compression_stats = compress_payload(data,
+                                                               self.data_encoding,
+                                                               self.data_compression,
+                                                               self.compression_level,
+                                                               precision=precision)
+        else:
+            payload = encode_payload(data, self.data_encoding, precision)
+
+        options.update(geojson_data=payload)
+
     def create_html(self, filename=None):
         """Create a circle visual from a geojson data source"""
         
@@ -278,7 +785,6 @@ class MapViz(object):
             style=style,
             center=list(self.center),
             zoom=self.zoom,
-            geojson_data=json.dumps(self.data, ensure_ascii=False),
             belowLayer=self.below_layer,
             opacity=self.opacity,
             minzoom=self.min_zoom,
@@ -290,6 +796,7 @@ class MapViz(object):
             scrollZoomOn=json.dumps(self.scroll_zoom_on),
             touchZoomOn=json.dumps(self.touch_zoom_on),
             popupOpensOnHover=self.popup_open_action=='hover',
+            popupProperties=json.dumps(self.popup_properties, ensure_ascii=False),
             includeSnapshotLinks=self.add_snapshot_links,
             preserveDrawingBuffer=json.dumps(self.add_snapshot_links),
             showScale=self.scale,
@@ -298,6 +805,7 @@ class MapViz(object):
             scalePosition=self.scale_position,
             scaleFillColor=self.scale_background_color,
             scaleTextColor=self.scale_text_color,
+            liveKey=self.data_key if self.live else None,
         )
 
         if self.legend:
@@ -321,6 +829,10 @@ class MapViz(object):
                 legendKeyBordersOn=json.dumps(self.legend_key_borders_on)
             )
 
+        if self.vector_join_mode not in ('match', 'feature-state'):
+            raise ValueError('vector_join_mode must be one of match, feature-state')
+
+        options.update(joinByFeatureState=False)
         if self.vector_source:
             options.update(
                 vectorUrl=self.vector_url,
@@ -328,7 +840,8 @@ class MapViz(object):
                 vectorJoinDataProperty=self.vector_join_property,
                 joinData=json.dumps(False),
                 dataJoinProperty=self.data_join_property,
-                enableDataJoin=not self.disable_data_join
+                enableDataJoin=not self.disable_data_join,
+                joinByFeatureState=self.vector_join_mode == 'feature-state' and not self.disable_data_join
             )
             data = geojson_to_dict_list(self.data)
             if bool(data):
@@ -346,8 +859,12 @@ class MapViz(object):
             labelHaloWidth=self.label_halo_width
         )
 
+        self.add_data_template_variables(options)
         self.add_unique_template_variables(options)
 
+        if 'colorStops' in options:
+            options.update(legendColorStops=self.legend_color_stops(options['colorStops']))
+
         if filename:
             html = templates.format(self.template, **options)
             with codecs.open(filename, "w", "utf-8-sig") as f:
@@ -357,7 +874,7 @@ class MapViz(object):
             return templates.format(self.template, **options)
 
 
-class CircleViz(VectorMixin, MapViz):
+class CircleViz(VectorMixin, ThinningMixin, MapViz):
     """Create a circle map"""
 
     def __init__(self,
@@ -371,6 +888,9 @@ class CircleViz(VectorMixin, MapViz):
                  stroke_width=0.1,
                  legend_key_shape='circle',
                  highlight_color='black',
+                 thinning_radius=None,
+                 thinning_property=None,
+                 thinning_maxzoom=14,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
@@ -383,6 +903,10 @@ class CircleViz(VectorMixin, MapViz):
         :param stroke_color: color of circle stroke outline
         :param stroke_width: with of circle stroke outline
         :param highlight_color: color for feature selection, hover, or highlight
+        :param thinning_radius: size in pixels of the grid cells that each keep at most one point per zoom level;
+                                points are shown from the zoom level they fit in (default shows all points)
+        :param thinning_property: numeric property to prioritize points with higher values when thinning
+        :param thinning_maxzoom: zoom level all points are shown from when thinning
 
         """
         super(CircleViz, self).__init__(data, *args, **kwargs)
@@ -399,11 +923,14 @@ class CircleViz(VectorMixin, MapViz):
         self.color_default = color_default
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.thinning_radius = thinning_radius
+        self.thinning_property = thinning_property
+        self.thinning_maxzoom = thinning_maxzoom
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to circle visual"""
         options.update(dict(
-            geojson_data=json.dumps(self.data, ensure_ascii=False),
+            levelOfDetail=self.thin_points(),
             colorProperty=self.color_property,
             colorType=self.color_function_type,
             colorStops=self.color_stops,
@@ -418,7 +945,7 @@ class CircleViz(VectorMixin, MapViz):
             options.update(vectorColorStops=self.generate_vector_color_map())
 
 
-class GraduatedCircleViz(VectorMixin, MapViz):
+class GraduatedCircleViz(VectorMixin, ThinningMixin, MapViz):
     """Create a graduated circle map"""
 
     def __init__(self,
@@ -435,6 +962,10 @@ class GraduatedCircleViz(VectorMixin, MapViz):
                  radius_function_type='interpolate',
                  legend_key_shape='circle',
                  highlight_color='black',
+                 bake_style=False,
+                 thinning_radius=None,
+                 thinning_property=None,
+                 thinning_maxzoom=14,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
@@ -450,6 +981,12 @@ class GraduatedCircleViz(VectorMixin, MapViz):
         :param stroke_color: color of circle stroke outline
         :param stroke_width: with of circle stroke outline
         :param highlight_color: color for feature selection, hover, or highlight
+        :param bake_style: boolean to precompute the color and size of each feature in Python; the layer paint
+                           then reads them from feature properties instead of evaluating the stops
+        :param thinning_radius: size in pixels of the grid cells that each keep at most one point per zoom level;
+                                points are shown from the zoom level they fit in (default shows all points)
+        :param thinning_property: numeric property to prioritize points with higher values when thinning
+        :param thinning_maxzoom: zoom level all points are shown from when thinning
 
         """
         super(GraduatedCircleViz, self).__init__(data, *args, **kwargs)
@@ -469,10 +1006,15 @@ class GraduatedCircleViz(VectorMixin, MapViz):
         self.stroke_width = stroke_width
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.bake_style = bake_style
+        self.thinning_radius = thinning_radius
+        self.thinning_property = thinning_property
+        self.thinning_maxzoom = thinning_maxzoom
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to graduated circle visual"""
         options.update(dict(
+            levelOfDetail=self.thin_points(),
             colorProperty=self.color_property,
             colorStops=self.color_stops,
             colorType=self.color_function_type,
@@ -501,6 +1043,8 @@ class HeatmapViz(VectorMixin, MapViz):
                  color_stops=None,
                  radius_stops=None,
                  intensity_stops=None,
+                 density_zooms=None,
+                 density_grid_size=1024,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
@@ -510,6 +1054,9 @@ class HeatmapViz(VectorMixin, MapViz):
         :param color_stops: stops to determine heatmap color.  EX. [[0, "red"], [0.5, "blue"], [1, "green"]]
         :param radius_stops: stops to determine heatmap radius based on zoom.  EX: [[0, 1], [12, 30]]
         :param intensity_stops: stops to determine the heatmap intensity based on zoom. EX: [[0, 0.1], [20, 5]]
+        :param density_zooms: zoom levels to precompute density grids for in Python, rendered as images in place
+                              of the points. EX: [0, 4, 8, 12]
+        :param density_grid_size: maximum number of density grid cells along each side of a precomputed image
         
         """
         super(HeatmapViz, self).__init__(data, *args, **kwargs)
@@ -524,9 +1071,67 @@ class HeatmapViz(VectorMixin, MapViz):
             self.color_stops = [[0.00001, 'rgba(0,0,0,0)']] + color_stops
         self.radius_stops = radius_stops
         self.intensity_stops = intensity_stops
+        self.density_zooms = density_zooms
+        self.density_grid_size = density_grid_size
+
+    def add_filter_template_variables(self, data, options):
+        """Heatmap layers have no opacity per feature to hide filtered features by"""
+        raise ValueError('filter_properties are not supported by HeatmapViz')
+
+    def add_frame_template_variables(self, data, options):
+        """Heatmap weights are not read from the feature state that frames are set as"""
+        raise ValueError('frame_values are not supported by HeatmapViz')
+
+    def update_data(self, data, key=None, lat='lat', lon='lon'):
+        """Replace the viz data and send it to the map shown with live; density images precomputed
+        with density_zooms are embedded with the map and cannot be updated
+        """
+        if self.precompute_density():
+            raise ValueError('update_data does not support HeatmapViz with density_zooms')
+        super(HeatmapViz, self).update_data(data, key=key, lat=lat, lon=lon)
+
+    def precompute_density(self):
+        """Whether density grids are precomputed in Python instead of embedding the points"""
+        return bool(self.density_zooms) and not self.vector_source and isinstance(self.data, dict)
+
+    def source_data(self):
+        """Precomputed density grids replace the points of the map source"""
+        if self.precompute_density():
+            return {'type': 'FeatureCollection', 'features': []}
+        return self.data
+
+    def density_images(self):
+        """Render a density grid of the points for each zoom level in density_zooms as a PNG image
+        colored with color_stops; each image is shown from its zoom level up to the next one
+        """
+        lon, lat = point_coordinates(self.data)
+
+        weights = None
+        if self.weight_property and self.weight_stops:
+            values = [(f.get('properties') or {}).get(self.weight_property) for f in self.data['features']]
+            weights = numpy.array(numeric_map_array(values, self.weight_stops, 1), dtype=float)
+
+        zooms = sorted(self.density_zooms)
+        images = []
+        for i, zoom in enumerate(zooms):
+            radius = numeric_map(zoom, self.radius_stops, 30) if self.radius_stops else 30
+            intensity = numeric_map(zoom, self.intensity_stops, 1) if self.intensity_stops else 1
+            density, coordinates = density_grid(lon, lat, weights, zoom, radius, intensity, self.density_grid_size)
+
+            rgba = color_ramp(density.ravel(), self.color_stops) * [1, 1, 1, 255]
+            image = numpy.rint(rgba).astype('uint8').reshape(density.shape + (4,))
+
+            images.append(dict(
+                url=img_encode(image),
+                coordinates=coordinates,
+                minzoom=self.min_zoom if i == 0 else zoom,
+                maxzoom=zooms[i + 1] if i + 1 < len(zooms) else self.max_zoom))
+
+        return images
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to heatmap visual"""
+        options.update(densityImages=json.dumps(self.density_images()) if self.precompute_density() else None)
         options.update(dict(
             colorStops=self.color_stops,
             radiusStops=self.radius_stops,
@@ -535,7 +1140,9 @@ class HeatmapViz(VectorMixin, MapViz):
             intensityStops=self.intensity_stops,
         ))
         if self.vector_source:
+            # heatmap paint properties cannot read feature state, so always join with match expressions
             options.update(dict(
+                joinByFeatureState=False,
                 vectorWeightStops=self.generate_vector_numeric_map('weight')))
 
     def generate_vector_numeric_map(self, numeric_property):
@@ -575,6 +1182,9 @@ class ClusteredCircleViz(MapViz):
                  stroke_width=0.1,
                  legend_key_shape='circle',
                  highlight_color='black',
+                 precompute_clusters=False,
+                 cluster_properties=None,
+                 max_cluster_ratio=0.25,
                  *args,
                  **kwargs):
         """Construct a Mapviz object 
@@ -588,6 +1198,13 @@ class ClusteredCircleViz(MapViz):
         :param radius_default: radius of circles not contained in a cluster
         :param color_default: color of circles not contained in a cluster
         :param highlight_color: color for feature selection, hover, or highlight
+        :param precompute_clusters: boolean to cluster points in Python for each zoom level up to cluster_maxzoom
+                                    instead of clustering all points in the browser
+        :param cluster_properties: dict of cluster property to [operator, point property] aggregated over the points
+                                   of precomputed clusters, with operator one of sum, min, max or mean
+        :param max_cluster_ratio: precomputed clustering stops at the first zoom level with more clusters than this
+                                  fraction of the points still clustered; the points are then shown from that zoom
+                                  level and only loaded when the map zooms in to it
 
         """
         super(ClusteredCircleViz, self).__init__(data, *args, **kwargs)
@@ -604,10 +1221,81 @@ class ClusteredCircleViz(MapViz):
         self.color_default = color_default
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.precompute_clusters = precompute_clusters
+        self.cluster_properties = cluster_properties
+        self.max_cluster_ratio = max_cluster_ratio
+
+    def include_cluster_points(self):
+        """Whether the map zooms in past the clusters, so unclustered points must be embedded"""
+        return self.max_zoom > self.clusterMaxZoom
+
+    def styling_properties(self):
+        """List the feature properties referenced by the cluster layer styles and filters"""
+        properties = super(ClusteredCircleViz, self).styling_properties()
+        if self.precompute_clusters:
+            properties += ['cluster', 'point_count', 'point_count_abbreviated', 'cluster_zoom']
+            properties += list(self.cluster_properties or {})
+        return properties
+
+    def add_filter_template_variables(self, data, options):
+        """Cluster counts cannot reflect filters, and browser cluster ids collide with feature ids"""
+        raise ValueError('filter_properties are not supported by ClusteredCircleViz')
+
+    def add_frame_template_variables(self, data, options):
+        """Cluster counts cannot follow frames, and browser cluster ids collide with feature ids"""
+        raise ValueError('frame_values are not supported by ClusteredCircleViz')
+
+    def source_data(self):
+        """Cluster points for each zoom level in Python with precompute_clusters, so that
+        the map source holds cluster centroids in place of points up to cluster_maxzoom
+        """
+        if not (self.precompute_clusters and isinstance(self.data, dict)):
+            return self.data
+
+        return cluster_points(self.data,
+                              cluster_radius=self.clusterRadius,
+                              cluster_maxzoom=self.clusterMaxZoom,
+                              cluster_properties=self.cluster_properties,
+                              include_points=self.include_cluster_points(),
+                              max_cluster_ratio=self.max_cluster_ratio)
+
+    def split_source_data(self, data, precision, options):
+        """Embed the points shown from the last cluster band in a script block added to the map source
+        when the map zooms in to that band, so that lower zoom levels only load clusters
+        """
+        options.update(clusterMaxBand=self.clusterMaxZoom + int(self.include_cluster_points()))
+        if not (self.precompute_clusters and isinstance(data, dict) and data['features']):
+            return data
+
+        band = max(feature['properties']['cluster_zoom'] for feature in data['features'])
+        options.update(clusterMaxBand=band)
+
+        # the map source must hold the embedded features when the map loads
+        if self.data_server or self.progressive or self.worker_parsing or self.data_compression:
+            return data
+
+        # points still clustered when clustering stopped come last, so appending them keeps feature ids
+        def deferred(feature):
+            return not feature['properties'].get('cluster') and feature['properties']['cluster_zoom'] == band
+
+        features = data['features']
+        split = len(features)
+        while split > 0 and deferred(features[split - 1]):
+            split -= 1
+        if split in (0, len(features)):
+            return data
+
+        # the layer filters read a missing band as the last band
+        points = dict(data, features=[dict(f, properties=OrderedDict((k, v) for k, v in f['properties'].items()
+                                                                     if k != 'cluster_zoom'))
+                                      for f in features[split:]])
+        options.update(clusterPoints=encode_payload(points, self.data_encoding, precision).replace('</', '<\\/'))
+        return dict(data, features=features[:split])
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to a clustered circle visual"""
         options.update(dict(
+            precomputedClusters=self.precompute_clusters,
             colorStops=self.color_stops,
             colorDefault=self.color_default,
             radiusStops=self.radius_stops,
@@ -620,7 +1308,7 @@ class ClusteredCircleViz(MapViz):
         ))
 
 
-class ChoroplethViz(VectorMixin, MapViz):
+class ChoroplethViz(VectorMixin, SimplifyMixin, MapViz):
     """Create a choropleth viz"""
 
     def __init__(self,
@@ -639,6 +1327,9 @@ class ChoroplethViz(VectorMixin, MapViz):
                  height_function_type='interpolate',
                  legend_key_shape='rounded-square',
                  highlight_color='black',
+                 bake_style=False,
+                 simplify_geometry=False,
+                 source_tolerance=0.375,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
@@ -661,6 +1352,11 @@ class ChoroplethViz(VectorMixin, MapViz):
         :param height_default: default height for 3D extruded polygons
         :param height_function_type: property to determine `type` used by Mapbox to assign height
         :param highlight_color: color for feature selection, hover, or highlight
+        :param bake_style: boolean to precompute the color and size of each feature in Python; the layer paint
+                           then reads them from feature properties instead of evaluating the stops
+        :param simplify_geometry: boolean to simplify polygon rings in Python to the source tolerance at the
+                                  source maxzoom, keeping the borders shared between polygons aligned
+        :param source_tolerance: simplification tolerance in pixels of the GeoJSON source
         """
         super(ChoroplethViz, self).__init__(data, *args, **kwargs)
         
@@ -681,6 +1377,15 @@ class ChoroplethViz(VectorMixin, MapViz):
         self.height_function_type = height_function_type
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.bake_style = bake_style
+        self.simplify_geometry = simplify_geometry
+        self.source_tolerance = source_tolerance
+
+    def add_filter_template_variables(self, data, options):
+        """Extrusion layers have no opacity per feature to hide filtered features by"""
+        if self.height_property and self.height_stops:
+            raise ValueError('filter_properties are not supported by extruded ChoroplethViz')
+        super(ChoroplethViz, self).add_filter_template_variables(data, options)
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to heatmap visual"""
@@ -713,6 +1418,8 @@ class ChoroplethViz(VectorMixin, MapViz):
             lineWidth=self.line_width,
             lineOpacity=self.line_opacity,
             extrudeChoropleth=self.extrude,
+            sourceMaxZoom=self.source_maxzoom(),
+            sourceTolerance=self.source_tolerance,
             highlightColor=self.highlight_color
         ))
         if self.extrude:
@@ -730,9 +1437,110 @@ class ChoroplethViz(VectorMixin, MapViz):
             if self.extrude:
                 options.update(vectorHeightStops=self.generate_vector_numeric_map('height'))
 
-        # geojson-based choropleth map variables
+
+class HexbinViz(ChoroplethViz):
+    """Create a hexbin map of point data aggregated into hexagons"""
+
+    def __init__(self,
+                 data,
+                 lat='lat',
+                 lon='lon',
+                 hex_radius=20,
+                 hex_zooms=None,
+                 aggregate_property=None,
+                 color_property='count',
+                 color_stops=None,
+                 colors='YlOrRd',
+                 *args,
+                 **kwargs):
+        """Construct a Mapviz object
+
+        :param data: GeoJSON Feature Collection of points or a pandas DataFrame with lat and lon columns
+        :param lat: name of the latitude column of a DataFrame
+        :param lon: name of the longitude column of a DataFrame
+        :param hex_radius: hexagon radius in pixels at the zoom level the points are binned at
+        :param hex_zooms: zoom levels to bin the points at; each binning is shown from its zoom level up to
+                          the next one (default bins once at the starting zoom of the map)
+        :param aggregate_property: numeric point property (or DataFrame column) summed and averaged per hexagon
+        :param color_property: hexagon property to determine fill color; one of count, sum or mean
+        :param color_stops: property to determine fill color; default stops are computed from the binned data
+        :param colors: ColorBrewer ramp or list of colors of the default color stops
+
+        """
+        super(HexbinViz, self).__init__(data, color_property=color_property, color_stops=color_stops,
+                                        *args, **kwargs)
+
+        self.template = 'hexbin'
+        self.lat = lat
+        self.lon = lon
+        self.hex_radius = hex_radius
+        self.hex_zooms = hex_zooms
+        self.aggregate_property = aggregate_property
+        self.colors = colors
+
+    def bin_zooms(self):
+        """Zoom levels the points are binned at"""
+        return sorted(self.hex_zooms) if self.hex_zooms else [int(self.zoom)]
+
+    def point_arrays(self):
+        """Longitudes, latitudes and aggregated values of the points as arrays"""
+        if isinstance(self.data, dict):
+            lon, lat = point_coordinates(self.data)
+            values = property_values(self.data, self.aggregate_property) if self.aggregate_property else None
         else:
-            options.update(geojson_data=json.dumps(self.data, ensure_ascii=False))
+            lon, lat = self.data[self.lon].values, self.data[self.lat].values
+            values = self.data[self.aggregate_property].values if self.aggregate_property else None
+        return lon, lat, values
+
+    def source_data(self):
+        """Bin the points into hexagons for each zoom level in hex_zooms"""
+        lon, lat, values = self.point_arrays()
+        zooms = self.bin_zooms()
+
+        features = []
+        for zoom in zooms:
+            hexagons = hexbin(lon, lat, values, zoom, self.hex_radius)['features']
+            if len(zooms) > 1:
+                for feature in hexagons:
+                    feature['properties']['hex_zoom'] = zoom
+            features.extend(hexagons)
+
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def default_color_stops(self, features):
+        """Color stops at quantiles of the color property of the hexagons"""
+        values = numpy.array([f['properties'][self.color_property] for f in features
+                              if f['properties'].get(self.color_property) is not None], dtype=float)
+        if not len(values):
+            return [[0, 'grey']]
+
+        breaks = numpy.unique(numpy.percentile(values, [0, 25, 50, 75, 95]))
+        if len(breaks) < 3:
+            breaks = numpy.linspace(values.min(), values.max() + 1, 3)
+        return create_color_stops(breaks.tolist(), colors=self.colors)
+
+    def styling_properties(self):
+        """List the hexagon properties referenced by the layer styles and filters"""
+        return super(HexbinViz, self).styling_properties() + ['hex_zoom']
+
+    def create_html(self, filename=None):
+        """Create the map HTML; without color_stops, default stops are computed from the hexagons of
+        the current data for this render only
+        """
+        if self.color_stops is not None:
+            return super(HexbinViz, self).create_html(filename)
+
+        self.color_stops = self.default_color_stops(self.source_data()['features'])
+        try:
+            return super(HexbinViz, self).create_html(filename)
+        finally:
+            self.color_stops = None
+
+    def add_unique_template_variables(self, options):
+        """Update map template variables specific to hexbin visual"""
+        super(HexbinViz, self).add_unique_template_variables(options)
+        zooms = self.bin_zooms()
+        options.update(hexZooms=json.dumps(zooms) if len(zooms) > 1 else None)
 
 
 class ImageViz(MapViz):
@@ -809,7 +1617,7 @@ class RasterTilesViz(MapViz):
             tiles_bounds=self.tiles_bounds if self.tiles_bounds else 'undefined'))
 
 
-class LinestringViz(VectorMixin, MapViz):
+class LinestringViz(VectorMixin, SimplifyMixin, MapViz):
     """Create a linestring viz"""
 
     def __init__(self,
@@ -825,6 +1633,8 @@ class LinestringViz(VectorMixin, MapViz):
                  line_width_function_type='interpolate',
                  legend_key_shape='line',
                  highlight_color='black',
+                 simplify_geometry=False,
+                 source_tolerance=0.375,
                  *args,
                  **kwargs):
         """Construct a Mapviz object
@@ -844,6 +1654,9 @@ class LinestringViz(VectorMixin, MapViz):
         :param line_width_default: property to determine default line width if match lookup fails
         :param line_width_function_type: property to determine `type` used by Mapbox to assign line width
         :param highlight_color: color for feature selection, hover, or highlight
+        :param simplify_geometry: boolean to simplify lines in Python to the source tolerance at the source maxzoom,
+                                  keeping the segments shared between lines aligned
+        :param source_tolerance: simplification tolerance in pixels of the GeoJSON source
         """
         super(LinestringViz, self).__init__(data, *args, **kwargs)
         
@@ -861,6 +1674,8 @@ class LinestringViz(VectorMixin, MapViz):
         self.line_width_function_type = line_width_function_type
         self.legend_key_shape = legend_key_shape
         self.highlight_color = highlight_color
+        self.simplify_geometry = simplify_geometry
+        self.source_tolerance = source_tolerance
 
     def add_unique_template_variables(self, options):
         """Update map template variables specific to linestring visual"""
@@ -891,6 +1706,8 @@ class LinestringViz(VectorMixin, MapViz):
             widthProperty=self.line_width_property,
             widthType=self.line_width_function_type,
             defaultWidth=self.line_width_default,
+            sourceMaxZoom=self.source_maxzoom(),
+            sourceTolerance=self.source_tolerance,
             highlightColor=self.highlight_color
         ))
 
@@ -907,7 +1724,4 @@ class LinestringViz(VectorMixin, MapViz):
             if self.line_width_property:
                 options.update(vectorWidthStops=self.generate_vector_numeric_map('line_width'))
 
-        # geojson-based linestring map variables
-        else:
-            options.update(geojson_data=json.dumps(self.data, ensure_ascii=False))
 
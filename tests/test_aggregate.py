@@ -0,0 +1,189 @@
+import base64
+import json
+
+import numpy
+import pytest
+
+from mapboxgl.errors import SourceDataError
+from mapboxgl.aggregate import (point_coordinates, mercator_pixels, mercator_lnglat, abbreviate_count,
+                                aggregate_groups, cluster_points, gaussian_kernel, convolve_separable,
+                                density_grid, group_keys, hexagon_cells, hexbin, thinning_zooms, filter_bins,
+                                bitset_b64, bitmap_index)
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+@pytest.fixture()
+def polygon_data():
+    with open('tests/polygons.geojson') as fh:
+        return json.loads(fh.read())
+
+
+def test_point_coordinates(data):
+    lon, lat = point_coordinates(data)
+    assert [lon[0], lat[0]] == data['features'][0]['geometry']['coordinates']
+
+
+def test_point_coordinates_polygons(polygon_data):
+    with pytest.raises(SourceDataError):
+        point_coordinates(polygon_data)
+
+
+def test_mercator_round_trip():
+    x, y = mercator_pixels([0, 10, -120], [0, 45, -60], 3)
+    assert x[0] == y[0] == 2048
+    lon, lat = mercator_lnglat(x, y, 3)
+    assert numpy.allclose(lon, [0, 10, -120])
+    assert numpy.allclose(lat, [0, 45, -60])
+
+
+def test_abbreviate_count():
+    assert [abbreviate_count(x) for x in [12, 1234, 3000, 12345]] == ['12', '1.2k', '3k', '12k']
+
+
+def test_aggregate_groups():
+    values = numpy.array([1.0, numpy.nan, 3.0, 4.0])
+    groups = numpy.array([0, 0, 1, 1])
+    assert aggregate_groups(values, groups, 3, 'sum').tolist()[:2] == [1.0, 7.0]
+    assert aggregate_groups(values, groups, 2, 'mean').tolist() == [1.0, 3.5]
+    assert aggregate_groups(values, groups, 2, 'min').tolist() == [1.0, 3.0]
+    assert aggregate_groups(values, groups, 2, 'max').tolist() == [1.0, 4.0]
+
+
+def test_cluster_points(data):
+    clustered = cluster_points(data, cluster_maxzoom=6, max_cluster_ratio=1,
+                               cluster_properties={'total': ['sum', 'Avg Medicare Payments']})
+    clusters = [f['properties'] for f in clustered['features'] if f['properties'].get('cluster')]
+    points = [f['properties'] for f in clustered['features'] if not f['properties'].get('cluster')]
+
+    assert [c['cluster_zoom'] for c in clusters] == [0, 1, 2, 3]
+    assert [c['point_count'] for c in clusters] == [3, 3, 3, 2]
+    assert clusters[0]['total'] == pytest.approx(sum(
+        f['properties']['Avg Medicare Payments'] for f in data['features']))
+
+    # each point is embedded once, from the zoom level it leaves all clusters
+    assert sorted(p['cluster_zoom'] for p in points) == [3, 4, 4]
+    assert len(points) == len(data['features'])
+
+
+def test_cluster_points_without_points(data):
+    clustered = cluster_points(data, cluster_maxzoom=2, include_points=False, max_cluster_ratio=1)
+    assert [f['properties']['point_count'] for f in clustered['features']] == [3, 3, 3]
+
+
+def test_cluster_points_ratio(data):
+    """Clustering stops at the zoom level where clusters barely reduce the points, which are shown from there"""
+    lon = numpy.concatenate([numpy.linspace(-0.5, 0.5, 20), numpy.linspace(99.5, 100.5, 20)])
+    lines = {'type': 'FeatureCollection',
+             'features': [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [x, 0.0]},
+                           'properties': {}} for x in lon.tolist()]}
+    clustered = cluster_points(lines, include_points=False)
+    clusters = [f['properties'] for f in clustered['features'] if f['properties'].get('cluster')]
+    points = [f['properties'] for f in clustered['features'] if not f['properties'].get('cluster')]
+
+    stop_zoom = points[-1]['cluster_zoom']
+    assert 0 < stop_zoom < 14 and len(points) == 40
+    assert max(c['cluster_zoom'] for c in clusters) == stop_zoom - 1
+    assert len(clusters) < 40
+
+    # a single cluster of three points at zoom 0 is not worth embedding
+    assert [f['properties']['cluster_zoom'] for f in cluster_points(data)['features']] == [0, 0, 0]
+
+
+def test_cluster_points_operator(data):
+    with pytest.raises(ValueError):
+        cluster_points(data, cluster_properties={'total': ['median', 'Avg Medicare Payments']})
+
+
+def test_gaussian_kernel():
+    kernel = gaussian_kernel(10, 2)
+    assert len(kernel) == 11
+    assert kernel[5] == 1
+    assert kernel[0] == pytest.approx(numpy.exp(-4.5))
+
+
+def test_convolve_separable():
+    grid = numpy.zeros((5, 5))
+    grid[2, 2] = 1
+    result = convolve_separable(grid, numpy.array([0.5, 1, 0.5]))
+    assert result[2, 2] == 1
+    assert result[1, 2] == result[2, 3] == 0.5
+    assert result[1, 1] == 0.25
+    assert result.sum() == 4
+
+
+def test_density_grid():
+    density, coordinates = density_grid([0, 0, 10], [0, 0, 5], weights=[1, 2, 1], zoom=4, radius=10, max_size=100)
+    assert max(density.shape) == 100
+    assert density.max() == pytest.approx(3 / numpy.sqrt(2 * numpy.pi), rel=0.05)
+    lons, lats = zip(*coordinates)
+    assert min(lons) < 0 < 10 < max(lons)
+    assert min(lats) < 0 < 5 < max(lats)
+
+
+def test_group_keys():
+    for keys in ([3, 1, 3, 0], [10 ** 9, 5, 10 ** 9]):
+        unique, groups, counts = group_keys(keys)
+        assert unique[groups].tolist() == keys
+        assert counts.tolist() == [numpy.sum(numpy.array(keys) == k) for k in unique]
+
+
+def test_hexagon_cells():
+    """Points are assigned to the hexagon with the nearest center"""
+    q, r = hexagon_cells(numpy.array([0.0, 10.0, 8.0]), numpy.array([0.0, 0.0, 14.0]), 10)
+    assert (q.tolist(), r.tolist()) == ([0, 1, 0], [0, 0, 1])
+
+
+def test_hexbin(data):
+    lon, lat = point_coordinates(data)
+    hexagons = hexbin(lon, lat, values=[1, 2, numpy.nan], zoom=0)
+    assert len(hexagons['features']) == 1
+    hexagon = hexagons['features'][0]
+    assert hexagon['properties'] == {'count': 3, 'sum': 3.0, 'mean': 1.5}
+
+    ring = numpy.array(hexagon['geometry']['coordinates'][0])
+    assert len(ring) == 7
+    assert ring[0].tolist() == ring[-1].tolist()
+    assert ring[:, 0].min() < lon.min() and lon.max() < ring[:, 0].max()
+
+    assert len(hexbin(lon, lat, zoom=8)['features']) == 3
+    assert hexbin(lon[:0], lat[:0], zoom=8)['features'] == []
+
+
+def test_thinning_zooms():
+    """Each grid cell shows one new point per zoom level, highest weight first"""
+    lon = numpy.array([0.0, 0.001, 0.002, 60.0])
+    lat = numpy.array([0.0, 0.0, 0.0, 0.0])
+    assert thinning_zooms(lon, lat, maxzoom=20).tolist() == [0, 14, 13, 0]
+    assert thinning_zooms(lon, lat, weights=[1, numpy.nan, 5, 2], maxzoom=20).tolist() == [13, 14, 0, 0]
+    assert thinning_zooms(lon, lat, maxzoom=4).tolist() == [0, 4, 4, 0]
+
+
+def test_filter_bins():
+    labels, codes = filter_bins([1, 2, 3, 4, None, 6], bins=2)
+    assert labels == ['1 to 3', '3 to 6', 'missing']
+    assert codes.tolist() == [0, 0, 1, 1, 2, 1]
+
+    labels, codes = filter_bins(['a', 'b', 'a', 'c', 'd'], bins=3)
+    assert labels == ['a', 'b', 'other']
+    assert codes.tolist() == [0, 1, 0, 2, 2]
+
+
+def test_bitset_b64():
+    mask = numpy.zeros(40, dtype=bool)
+    mask[[0, 33]] = True
+    words = numpy.frombuffer(base64.b64decode(bitset_b64(mask)), dtype='<u4')
+    assert words.tolist() == [1, 2]
+
+
+def test_bitmap_index(data):
+    index = bitmap_index(data, ['Provider Id', 'type'], bins=2, tables={'type': ['hospital']})
+    assert index['count'] == 3
+    providers, types = index['dimensions']
+    assert providers['labels'] == ['0 to 10001', '10001 to 10005']
+    assert types['labels'] == ['missing']
+    assert len(providers['bitsets']) == 2
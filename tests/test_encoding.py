@@ -0,0 +1,267 @@
+import base64
+import gzip
+import json
+
+import numpy
+import pytest
+
+from mapboxgl.errors import SourceDataError
+from mapboxgl.encoding import (precision_for_zoom, quantize, format_fixed, format_coordinates, iter_geojson,
+                               delta_coordinates, delta_payload, topology_payload, select_properties, split_properties,
+                               categorical_properties, dictionary_encode,
+                               geojson_to_columns, columnar_payload,
+                               binary_column, binary_payload, frames_payload, encode_payload, gzip_chunks,
+                               compress_payload)
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+@pytest.fixture()
+def polygon_data():
+    with open('tests/polygons.geojson') as fh:
+        return json.loads(fh.read())
+
+
+def test_precision_for_zoom():
+    assert precision_for_zoom(0) == 1
+    assert precision_for_zoom(14) == 5
+    assert precision_for_zoom(24) == 8
+
+
+def test_quantize():
+    assert quantize([-85.362856, 31.216215], 3).tolist() == [-85363, 31216]
+
+
+def test_format_fixed():
+    assert format_fixed([1, 2.5, -3.14159], 2) == '1.00,2.50,-3.14'
+    assert format_fixed([[1, 2], [3, 4]], 1, '[{},{}]') == '[1.0,2.0],[3.0,4.0]'
+
+
+def test_format_coordinates():
+    assert format_coordinates([[[0, 0], [1.23456, 0], [0, 1]]], 3) == '[[[0.000,0.000],[1.235,0.000],[0.000,1.000]]]'
+    assert format_coordinates([1.23456, 2, 3], 1) == '[1.2,2.0,3.0]'
+
+
+def test_iter_geojson(data, polygon_data):
+    """Fixed precision output is valid GeoJSON with rounded coordinates"""
+    points = json.loads(''.join(iter_geojson(data, 4)))
+    assert points['features'][0]['geometry']['coordinates'] == [-85.3629, 31.2162]
+    assert points['features'][0]['properties'] == data['features'][0]['properties']
+
+    polygons = json.loads(''.join(iter_geojson(polygon_data, 4)))
+    assert polygons['features'][0]['id'] == polygon_data['features'][0]['id']
+    assert len(''.join(iter_geojson(polygon_data, 4))) < len(json.dumps(polygon_data))
+
+
+def test_delta_coordinates():
+    line = [[10.0, 20.0], [10.5, 20.25], [11.0, 20.0]]
+    assert delta_coordinates(line, 2) == [[1000, 2000], [50, 25], [50, -25]]
+    assert delta_coordinates([10.0, 20.0], 2) == [1000, 2000]
+
+
+def test_delta_payload(polygon_data):
+    payload = delta_payload(polygon_data, 5)
+    ring = numpy.cumsum(payload['features'][0]['geometry']['coordinates'][0], axis=0) / 1e5
+    original = polygon_data['features'][0]['geometry']['coordinates'][0]
+    assert numpy.allclose(ring, original, atol=1e-5)
+
+
+def test_topology_payload():
+    """The border of two neighbouring squares is stored once and referenced in reverse"""
+    squares = [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]], [[1, 0], [2, 0], [2, 1], [1, 1], [1, 0]]]
+    data = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'id': i}, 'geometry': {'type': 'Polygon', 'coordinates': [ring]}}
+        for i, ring in enumerate(squares)] + [
+        {'type': 'Feature', 'properties': {}, 'geometry': {'type': 'Point', 'coordinates': [0.5, 0.5]}}]}
+
+    payload = topology_payload(data, 1)
+    assert payload['encoding'] == 'topojson'
+    assert len(payload['arcs']) == 3
+    assert payload['arcs'][0] == [[10, 0], [0, 10]]
+
+    first, second = [f['geometry']['arcs'][0] for f in payload['features'][:2]]
+    assert 0 in first and ~0 in second
+    assert payload['features'][2]['geometry']['coordinates'] == [5, 5]
+
+    # arcs of a ring join into the original ring
+    arcs = [numpy.cumsum(arc, axis=0) / 10.0 for arc in payload['arcs']]
+    ring = []
+    for reference in second:
+        arc = arcs[reference] if reference >= 0 else arcs[~reference][::-1]
+        ring.extend(arc.tolist()[1 if ring else 0:])
+    assert len(ring) == 5 and ring[0] == ring[-1]
+    assert sorted(map(tuple, ring[:-1])) == sorted(map(tuple, squares[1][:-1]))
+
+
+def test_select_properties(data):
+    selected = select_properties(data, ['Provider Id', 'missing'])
+    assert list(selected['features'][0]['properties'].keys()) == ['Provider Id']
+    assert selected['features'][0]['geometry'] == data['features'][0]['geometry']
+    assert len(data['features'][0]['properties']) == 4
+
+
+def test_split_properties(data):
+    kept, table = split_properties(data, ['Provider Id'])
+    assert list(kept['features'][1]['properties'].keys()) == ['Provider Id']
+    assert list(table.keys()) == ['Avg Medicare Payments', 'Avg Covered Charges', 'Avg Total Payments']
+    assert table['Avg Total Payments'][1] == data['features'][1]['properties']['Avg Total Payments']
+
+
+@pytest.fixture()
+def categorical_data():
+    states = ['CA', 'CA', 'NV', 'CA', None, 'NV']
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature',
+         'geometry': {'type': 'Point', 'coordinates': [i, i]},
+         'properties': {'state': state, 'name': 'site {}'.format(i), 'value': i}}
+        for i, state in enumerate(states)]}
+
+
+def test_categorical_properties(categorical_data):
+    """Only repeated string properties are treated as categorical"""
+    assert categorical_properties(categorical_data) == {'state': ['CA', 'NV']}
+
+
+def test_dictionary_encode(categorical_data):
+    encoded, tables = dictionary_encode(categorical_data)
+    assert [f['properties']['state'] for f in encoded['features']] == [0, 0, 1, 0, None, 1]
+    assert encoded['features'][0]['properties']['name'] == 'site 0'
+    assert categorical_data['features'][0]['properties']['state'] == 'CA'
+    assert tables == {'state': ['CA', 'NV']}
+
+
+def test_dictionary_encode_exclude(categorical_data):
+    encoded, tables = dictionary_encode(categorical_data, exclude=['state'])
+    assert tables == {}
+    assert encoded['features'][0]['properties']['state'] == 'CA'
+
+
+def test_dictionary_encode_properties(categorical_data):
+    """Listed properties are indexed regardless of value type and cardinality"""
+    encoded, tables = dictionary_encode(categorical_data, properties=['name', 'value'])
+    assert list(tables.keys()) == ['name', 'value']
+    assert tables['value'] == [0, 1, 2, 3, 4, 5]
+    assert [f['properties']['name'] for f in encoded['features']] == [0, 1, 2, 3, 4, 5]
+    assert encoded['features'][2]['properties']['state'] == 'NV'
+
+
+def test_geojson_to_columns(data):
+    coordinates, properties = geojson_to_columns(data)
+    assert len(coordinates) == 6
+    assert coordinates[:2] == data['features'][0]['geometry']['coordinates']
+    assert properties['Provider Id'] == [f['properties']['Provider Id'] for f in data['features']]
+
+
+def test_geojson_to_columns_missing_property(data):
+    del data['features'][1]['properties']['Provider Id']
+    coordinates, properties = geojson_to_columns(data)
+    assert properties['Provider Id'][1] is None
+
+
+def test_geojson_to_columns_polygons(polygon_data):
+    """Columnar encoding is limited to point features"""
+    with pytest.raises(SourceDataError):
+        geojson_to_columns(polygon_data)
+
+
+def test_columnar_payload(data):
+    payload = columnar_payload(data)
+    assert payload['encoding'] == 'columnar'
+    assert 'ids' not in payload
+
+
+def test_frames_payload():
+    """Frame values are packed as float32, carrying missing values forward"""
+    payload = frames_payload([[1.0, numpy.nan], [numpy.nan, 2.0], [3.0, numpy.nan]])
+    assert (payload['frames'], payload['features']) == (3, 2)
+    values = numpy.frombuffer(base64.b64decode(payload['values']), dtype='<f4').reshape(3, 2)
+    numpy.testing.assert_array_equal(values, [[1.0, numpy.nan], [1.0, 2.0], [3.0, 2.0]])
+
+    with pytest.raises(ValueError):
+        frames_payload([1.0, 2.0])
+
+
+def test_binary_column_int():
+    column = binary_column([1, 2, 3])
+    assert column['type'] == 'int32'
+    assert numpy.frombuffer(base64.b64decode(column['data']), '<i4').tolist() == [1, 2, 3]
+
+
+def test_binary_column_float_missing():
+    """Missing numeric values are packed as NaN"""
+    column = binary_column([1.5, None, 3])
+    assert column['type'] == 'float64'
+    values = numpy.frombuffer(base64.b64decode(column['data']), '<f8')
+    assert values[0] == 1.5 and numpy.isnan(values[1])
+
+
+def test_binary_column_strings():
+    column = binary_column(['a', None, 'b'])
+    assert column == {'type': 'json', 'data': ['a', None, 'b']}
+
+
+def test_binary_column_types():
+    """NumPy scalars are packed like Python numbers, booleans and large integers are not packed as Int32"""
+    assert binary_column([numpy.int64(1), 2])['type'] == 'int32'
+    assert binary_column([numpy.float32(1.5), 2])['type'] == 'float64'
+    assert binary_column([True, 1])['type'] == 'json'
+    assert binary_column([1, 2 ** 40])['type'] == 'float64'
+    assert binary_column([None, None])['type'] == 'float64'
+
+
+def test_binary_payload(data):
+    payload = binary_payload(data)
+    coordinates = numpy.frombuffer(base64.b64decode(payload['coordinates']), '<f4')
+    assert payload['count'] == 3
+    assert coordinates.shape == (6,)
+    assert numpy.allclose(coordinates[:2], data['features'][0]['geometry']['coordinates'])
+    assert payload['properties']['Provider Id']['type'] == 'int32'
+
+
+def test_encode_payload_geojson(data):
+    assert json.loads(encode_payload(data)) == data
+
+
+def test_encode_payload_columnar(data):
+    js = encode_payload(data, 'columnar')
+    assert js.startswith('decodeGeoJSON(')
+    assert len(js) < len(encode_payload(data))
+
+
+def test_encode_payload_precision(data):
+    js = encode_payload(data, 'geojson', precision=3)
+    assert json.loads(js)['features'][0]['geometry']['coordinates'] == [-85.363, 31.216]
+
+
+def test_encode_payload_url():
+    """Data URLs are passed through to the template unchanged"""
+    assert encode_payload('points.geojson', 'columnar') == '"points.geojson"'
+
+
+def test_encode_payload_invalid(data):
+    with pytest.raises(ValueError):
+        encode_payload(data, 'xml')
+
+
+def test_gzip_chunks():
+    text = ['{"a":1}'] * 10000
+    compressed, raw_size = gzip_chunks(iter(text), buffer_size=1024)
+    assert raw_size == len(''.join(text))
+    assert gzip.decompress(compressed).decode() == ''.join(text)
+
+
+def test_compress_payload(data):
+    js, stats = compress_payload(data, 'columnar', compression_level=9)
+    assert js.startswith("inflateGeoJSON('data', '")
+    inflated = json.loads(gzip.decompress(base64.b64decode(js.split("'")[3])).decode())
+    assert inflated == json.loads(json.dumps(columnar_payload(data)))
+    assert stats['ratio'] == round(float(stats['raw_bytes']) / stats['compressed_bytes'], 2)
+
+
+def test_compress_payload_invalid(data):
+    with pytest.raises(ValueError):
+        compress_payload(data, compression='bz2')
@@ -0,0 +1,127 @@
+import json
+
+import numpy
+import pandas as pd
+import pytest
+
+from mapboxgl.geometry import (geometry_lines, replace_lines, douglas_peucker, junctions, simplify_geometries,
+                               feature_bounds, hilbert_index, view_bounds, SpatialIndex)
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+@pytest.fixture()
+def polygon_data():
+    with open('tests/polygons.geojson') as fh:
+        return json.loads(fh.read())
+
+
+def vertex_count(data):
+    return sum(len(positions) for feature in data['features']
+               for positions, _ in geometry_lines(feature['geometry']))
+
+
+def square(x0, y0, size, steps=50):
+    """Closed counterclockwise square ring with steps positions per side"""
+    side = numpy.linspace(0, size, steps, endpoint=False)
+    ring = ([[x0 + t, y0] for t in side] + [[x0 + size, y0 + t] for t in side] +
+            [[x0 + size - t, y0 + size] for t in side] + [[x0, y0 + size - t] for t in side])
+    return [[round(x, 6), round(y, 6)] for x, y in ring] + [[x0, y0]]
+
+
+def test_geometry_lines():
+    multipolygon = {'type': 'MultiPolygon', 'coordinates': [[[[0, 0], [1, 0], [0, 1], [0, 0]]], [[[2, 2]]]]}
+    lines = geometry_lines(multipolygon)
+    assert [ring for _, ring in lines] == [True, True]
+
+    replaced = replace_lines(multipolygon, iter([['a'], ['b']]))
+    assert replaced['coordinates'] == [[['a']], [['b']]]
+    assert multipolygon['coordinates'][1] == [[[2, 2]]]
+
+
+def test_douglas_peucker():
+    points = numpy.array([[0, 0], [1, 0.1], [2, -0.1], [3, 5], [4, 6], [5, 7]], dtype=float)
+    assert douglas_peucker(points, 0.5).tolist() == [True, False, True, True, False, True]
+    assert douglas_peucker(points, 10).tolist() == [True, False, False, False, False, True]
+
+
+def test_junctions():
+    points = numpy.array([[0, 0], [1, 0], [2, 0], [3, 0]], dtype=float)
+    assert junctions(points, numpy.ones(4), numpy.ones(4), ring=False).tolist() == [0, 3]
+    # the edges from vertex 1 to vertex 3 are shared with a second line
+    vertices, edges = numpy.array([1, 3, 3, 3.0]), numpy.array([1, 3, 3, 1.0])
+    assert junctions(points, vertices, edges, ring=True).tolist() == [1, 3]
+    assert junctions(points[::-1], numpy.ones(4), numpy.ones(4), ring=True).tolist() == [3]
+
+
+def test_simplify_geometries():
+    """Neighbouring squares keep their shared border vertex for vertex"""
+    data = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'id': i}, 'geometry': {'type': 'Polygon', 'coordinates': [square(i, 0, 1)]}}
+        for i in range(3)]}
+
+    simplified = simplify_geometries(data, zoom=6)
+    assert vertex_count(data) == 603
+    assert vertex_count(simplified) == 3 * 5
+    assert simplified['features'][0]['properties'] == {'id': 0}
+
+    rings = [set(map(tuple, f['geometry']['coordinates'][0])) for f in simplified['features']]
+    assert rings[0] & rings[1] == {(1, 0), (1, 1)}
+    assert data['features'][0]['geometry']['coordinates'][0] == square(0, 0, 1)
+
+
+def test_simplify_geometries_tolerance(polygon_data):
+    detailed = simplify_geometries(polygon_data, zoom=14)
+    coarse = simplify_geometries(polygon_data, zoom=2)
+    assert vertex_count(coarse) < vertex_count(detailed) <= vertex_count(polygon_data)
+    for feature in coarse['features']:
+        for ring, _ in geometry_lines(feature['geometry']):
+            assert len(ring) >= 4 and ring[0] == ring[-1]
+
+
+def test_feature_bounds(data, polygon_data):
+    assert feature_bounds(data)[0].tolist() == [-85.36285599999992, 31.216214999999963] * 2
+    bounds = feature_bounds(polygon_data)
+    assert (bounds[:, :2] <= bounds[:, 2:]).all()
+    assert numpy.isnan(feature_bounds({'features': [{'geometry': None}]})).all()
+
+
+def test_hilbert_index():
+    """Consecutive cells along the curve are neighbours"""
+    x, y = numpy.meshgrid(numpy.arange(8), numpy.arange(8))
+    distance = hilbert_index(x.ravel(), y.ravel(), bits=3)
+    assert sorted(distance.tolist()) == list(range(64))
+    order = numpy.argsort(distance)
+    steps = numpy.abs(numpy.diff(x.ravel()[order])) + numpy.abs(numpy.diff(y.ravel()[order]))
+    assert (steps == 1).all()
+
+
+def test_view_bounds():
+    west, south, east, north = view_bounds((0, 0), 1, 512, 256, margin=0)
+    assert (west, east) == (-90, 90)
+    assert numpy.isclose(south, -north)
+    assert numpy.allclose(view_bounds((170, 0), 2, 512, 512, margin=0)[::2], [125, -145])
+    assert view_bounds((0, 0), 0, 1000, 500)[:3:2] == [-180, 180]
+
+
+def test_SpatialIndex():
+    random = numpy.random.RandomState(0)
+    df = pd.DataFrame({'lon': random.uniform(-180, 180, 1000), 'lat': random.uniform(-80, 80, 1000)})
+    index = SpatialIndex(df, node_size=4)
+    assert len(index.levels) == 5
+
+    for bounds in ([-10, -20, 30, 40], [170, -80, -170, 80], [0, 0, 0, 0]):
+        west, south, east, north = bounds
+        inside = (df.lat >= south) & (df.lat <= north)
+        inside &= (df.lon >= west) & (df.lon <= east) if west <= east else (df.lon >= west) | (df.lon <= east)
+        assert index.query(bounds).tolist() == numpy.flatnonzero(inside).tolist()
+
+
+def test_SpatialIndex_features(polygon_data):
+    polygon_data['features'].append({'type': 'Feature', 'properties': {}, 'geometry': None})
+    index = SpatialIndex(polygon_data)
+    assert index.query([-180, -90, 180, 90]).tolist() == list(range(len(polygon_data['features']) - 1))
@@ -3,6 +3,9 @@ import json
 import base64
 import random
 
+import numpy
+import pandas as pd
+
 from mock import patch
 
 import pytest
@@ -10,6 +13,7 @@ import pytest
 from mapboxgl.viz import *
 from mapboxgl.errors import TokenError, LegendError
 from mapboxgl.utils import create_color_stops, create_numeric_stops
+from mapboxgl.server import DataServer
 from matplotlib.pyplot import imread
 
 
@@ -423,4 +427,459 @@ def test_display_RasterTileViz(display, data):
     """Assert that show calls the mocked display function
     """
     tiles_url = 'https://a.tile.openstreetmap.org/{z}/{x}/{y}.png'
-    viz = RasterTilesViz(tiles_url, access_token=TOKEN)
\ No newline at end of file
+    viz = RasterTilesViz(tiles_url, access_token=TOKEN)
+
+def test_columnar_encoding_CircleViz(data):
+    """Columnar data encoding shrinks the embedded payload"""
+    viz = CircleViz(data,
+                    color_property="Avg Medicare Payments",
+                    access_token=TOKEN)
+    geojson_html = viz.create_html()
+    viz.data_encoding = 'columnar'
+    columnar_html = viz.create_html()
+    assert 'decodeGeoJSON({"encoding":"columnar"' in columnar_html
+    assert len(columnar_html) < len(geojson_html)
+
+
+@patch('mapboxgl.viz.display')
+def test_display_columnar_ClusteredCircleViz(display, data):
+    viz = ClusteredCircleViz(data,
+                             color_stops=[[1, 'red'], [10, 'blue']],
+                             radius_stops=[[1, 5], [10, 20]],
+                             data_encoding='columnar',
+                             access_token=TOKEN)
+    viz.show()
+    display.assert_called_once()
+
+
+def test_binary_encoding_HeatmapViz(data):
+    viz = HeatmapViz(data,
+                     weight_property="Avg Medicare Payments",
+                     weight_stops=[[10, 0], [100, 1]],
+                     color_stops=[[0, "red"], [0.5, "blue"], [1, "green"]],
+                     data_encoding='binary',
+                     access_token=TOKEN)
+    assert 'decodeGeoJSON({"encoding":"binary"' in viz.create_html()
+
+
+def test_gzip_compression_ChoroplethViz(polygon_data):
+    viz = ChoroplethViz(polygon_data,
+                        color_property="density",
+                        color_stops=[[0.0, "red"], [50.0, "gold"], [1000.0, "blue"]],
+                        data_compression='gzip',
+                        access_token=TOKEN)
+    html = viz.create_html()
+    assert "inflateGeoJSON('data'" in html
+    assert viz.compression_stats['ratio'] > 1
+
+
+def test_delta_encoding_LinestringViz(linestring_data):
+    viz = LinestringViz(linestring_data,
+                        color_property="sample",
+                        color_stops=[[0.0, "red"], [50.0, "gold"], [1000.0, "blue"]],
+                        data_encoding='delta',
+                        coordinate_precision='auto',
+                        max_zoom=14,
+                        access_token=TOKEN)
+    assert 'decodeGeoJSON({"encoding":"delta","precision":5' in viz.create_html()
+
+
+def test_topojson_encoding_ChoroplethViz(polygon_data):
+    viz = ChoroplethViz(polygon_data,
+                        color_property="density",
+                        color_stops=[[0.0, "red"], [50.0, "gold"], [1000.0, "blue"]],
+                        data_encoding='topojson',
+                        access_token=TOKEN)
+    html = viz.create_html()
+    assert 'decodeGeoJSON({"encoding":"topojson","precision":8,"arcs":[[' in html
+    assert 'function decodeTopologyGeometry' in html
+
+
+def test_dictionary_encoding_CircleViz(data):
+    data['features'] = data['features'] * 2
+    for i, feature in enumerate(data['features']):
+        feature['properties'] = dict(feature['properties'], type='hospital' if i % 3 else 'clinic')
+    viz = CircleViz(data,
+                    color_property='type',
+                    color_function_type='match',
+                    color_stops=[['hospital', 'red'], ['clinic', 'blue']],
+                    label_property='type',
+                    dictionary_encoding=True,
+                    access_token=TOKEN)
+    html = viz.create_html()
+    assert 'var propertyTables = {"type": ["hospital", "clinic"]}' in html
+    assert '"type": 1' in html
+
+
+def test_popup_properties_GraduatedCircleViz(data):
+    """Only styled and popup properties are embedded when popup_properties is set"""
+    viz = GraduatedCircleViz(data,
+                             color_property="Avg Medicare Payments",
+                             radius_property="Avg Covered Charges",
+                             popup_properties=['Provider Id'],
+                             access_token=TOKEN)
+    assert viz.styling_properties() == ["Avg Medicare Payments", "Avg Covered Charges"]
+    html = viz.create_html()
+    assert 'var popupProperties = ["Provider Id"]' in html
+    assert "Avg Total Payments" not in html
+    assert "Avg Covered Charges" in html
+
+
+def test_popup_table_ChoroplethViz(polygon_data):
+    """Popup-only properties are moved out of the map source into a separate table"""
+    viz = ChoroplethViz(polygon_data,
+                        color_property="density",
+                        color_stops=[[0.0, "red"], [50.0, "gold"], [1000.0, "blue"]],
+                        popup_table=True,
+                        access_token=TOKEN)
+    html = viz.create_html()
+    table = html.split("<script type='application/json' id='popup-table'>")[1].split('</script>')[0]
+    assert list(json.loads(table).keys()) == ['name']
+    assert '"name"' not in html.split("map.addSource")[1].split("map.addLayer")[0]
+    assert 'if (table === null || f.properties.cluster) {' in html
+
+
+def test_popup_handler_LinestringViz(linestring_data):
+    """Popup and hover events go through the shared frame-throttled handler"""
+    html = LinestringViz(linestring_data, access_token=TOKEN).create_html()
+    assert "addPopupHandler(popup, popupAction, ['linestring', 'linestring-label'], {source: 'data'}" in html
+    assert 'hoveredStateId' not in html
+
+    html = LinestringViz([{"elevation": 10}],
+                         vector_url='mapbox://mapbox.mapbox-terrain-v2',
+                         vector_layer_name='contour',
+                         vector_join_property='ele',
+                         data_join_property='elevation',
+                         access_token=TOKEN).create_html()
+    assert "{source: 'vector-data', sourceLayer: \"contour\"}" in html
+    assert 'queryRenderedFeatures' not in html
+    assert "internalProperties = ['lod_zoom', 'cluster_zoom', 'hex_zoom']" in html
+
+
+def test_feature_state_join_ChoroplethViz():
+    """Feature-state joins promote the join property and do not build filters over join keys"""
+    data = [{"id": "06", "name": "California", "density": 241.7},
+            {"id": "11", "name": "District of Columbia", "density": 10065}]
+
+    viz = ChoroplethViz(data,
+                        vector_url='mapbox://mapbox.us_census_states_2015',
+                        vector_layer_name='states',
+                        vector_join_property='STATEFP',
+                        data_join_property='id',
+                        color_property='density',
+                        color_stops=create_color_stops([0, 50, 100, 500, 1500], colors='YlOrRd'),
+                        height_property='density',
+                        height_stops=[[0, 0], [1500, 50000]],
+                        vector_join_mode='feature-state',
+                        access_token=TOKEN)
+    html = viz.create_html()
+    assert 'var joinByFeatureState = true' in html
+    assert 'promoteId: {"states": "STATEFP"}' in html
+    assert "let layerFilter = ['all'];" in html
+    assert 'layerFilter.push' not in html
+    assert 'setJoinStates("vector-data", "states");' in html
+    assert 'joinByFeatureState && !state.joined' in html
+
+    viz.vector_join_mode = 'match'
+    html = viz.create_html()
+    assert 'var joinByFeatureState = false' in html
+    assert 'promoteId' not in html
+
+    viz.vector_join_mode = 'lookup'
+    with pytest.raises(ValueError):
+        viz.create_html()
+
+
+def test_category_indexing_CircleViz(data):
+    """Match-styled categories are embedded as indices and the legend lists the most frequent ones"""
+    data['features'] = data['features'] * 2
+    for i, feature in enumerate(data['features']):
+        feature['properties'] = dict(feature['properties'], type='hospital' if i % 3 else 'clinic')
+    viz = CircleViz(data,
+                    color_property='type',
+                    color_function_type='match',
+                    color_stops=[['clinic', 'blue'], ['pharmacy', 'green'], ['hospital', 'red']],
+                    category_indexing=True,
+                    legend_max_categories=2,
+                    access_token=TOKEN)
+    assert viz.match_properties() == ['type']
+    html = viz.create_html()
+    assert 'var propertyTables = {"type": ["hospital", "clinic"]}' in html
+    assert "calcColorLegend([['hospital', 'red'], ['clinic', 'blue']]" in html
+
+
+def test_bake_style_GraduatedCircleViz(data):
+    """Baked styles are embedded per feature and read with get expressions"""
+    viz = GraduatedCircleViz(data,
+                             color_property="Avg Medicare Payments",
+                             color_stops=create_color_stops([0, 10000, 20000], colors='Blues'),
+                             radius_property="Avg Covered Charges",
+                             radius_stops=[[0, 1], [100000, 10]],
+                             bake_style=True,
+                             access_token=TOKEN)
+    html = viz.create_html()
+    assert 'var styleProperties = {"color": "_color", "radius": "_radius"}' in html
+    assert '"_color": "#' in html
+    assert '"_radius": ' in html
+    assert 'calcColorLegend([[0, ' in html
+
+
+def test_bake_style_dictionary_encoding_GraduatedCircleViz(data):
+    """Baked colors are read by the layer paint, so they are never dictionary-encoded"""
+    data['features'] = data['features'] * 4
+    for i, feature in enumerate(data['features']):
+        feature['properties'] = dict(feature['properties'], kind='a' if i % 2 else 'b')
+    viz = GraduatedCircleViz(data,
+                             color_property='kind',
+                             color_function_type='match',
+                             color_stops=[['a', 'red'], ['b', 'blue']],
+                             bake_style=True,
+                             dictionary_encoding=True,
+                             access_token=TOKEN)
+    html = viz.create_html()
+    tables = json.loads(html.split('var propertyTables = ')[1].split(',\n')[0])
+    assert list(tables) == ['kind']
+    assert '"_color": "blue"' in html
+
+
+def test_precompute_clusters_ClusteredCircleViz(data):
+    """Precomputed clusters replace browser clustering and are filtered by zoom band"""
+    viz = ClusteredCircleViz(data,
+                             color_stops=create_color_stops([1, 10, 50], colors='Blues'),
+                             radius_stops=[[1, 5], [10, 10], [50, 15]],
+                             cluster_maxzoom=6,
+                             precompute_clusters=True,
+                             cluster_properties={'total': ['sum', 'Avg Medicare Payments']},
+                             max_cluster_ratio=1,
+                             popup_properties=['Provider Id'],
+                             dictionary_encoding=True,
+                             access_token=TOKEN)
+    html = viz.create_html()
+    assert '"cluster": false' in html
+    assert '"clusterRadius"' not in html
+    assert 'clusterBandFilter(true, map.getZoom(), 4)' in html
+    assert '"point_count": 3' in html
+    assert 'generateTextField("{point_count_abbreviated}")' in html
+    assert '"point_count_abbreviated": ["3", "2"]' in html
+
+    # the points of the last band are added to the source when the map zooms in to it
+    assert "addClusterPoints('data', 'cluster-points', 4);" in html
+    source, points = html.split("id='cluster-points'>")
+    points, source = points.split('</script>', 1)
+    assert source.count('"cluster_zoom": 4') == 0
+    assert points.count('"Provider Id"') == 2 and '"cluster_zoom"' not in points
+
+    viz.data_compression = 'gzip'
+    assert "addClusterPoints('data'" not in viz.create_html()
+
+
+def test_density_zooms_HeatmapViz(data):
+    """Precomputed density grids are embedded as images in place of the points"""
+    viz = HeatmapViz(data,
+                     weight_property="Avg Medicare Payments",
+                     weight_stops=[[10, 0], [100, 1]],
+                     color_stops=[[0.5, "red"], [1, "blue"]],
+                     radius_stops=[[0, 1], [12, 30]],
+                     density_zooms=[0, 6],
+                     density_grid_size=64,
+                     access_token=TOKEN)
+    html = viz.create_html()
+    assert html.count('data:image/png;base64,') == 2
+    assert '"minzoom": 0, "maxzoom": 6' in html
+    assert '"minzoom": 6, "maxzoom": 24' in html
+    assert "Provider Id" not in html
+
+
+def test_HexbinViz(data):
+    """Hexbin maps bin points into choropleth hexagons per zoom band"""
+    viz = HexbinViz(data, hex_zooms=[4, 8], access_token=TOKEN)
+    html = viz.create_html()
+    assert 'var hexZooms = [4, 8]' in html
+    assert html.count('"hex_zoom": 8') == 3
+    assert '"count", [[1.0, ' in html
+    assert viz.color_stops is None
+
+
+def test_HexbinViz_default_color_stops(data):
+    """Default hexbin color stops follow the data of each render"""
+    viz = HexbinViz(data, access_token=TOKEN)
+    assert '"count", [[3.0, ' in viz.create_html()
+
+    viz.data = {'type': 'FeatureCollection', 'features': data['features'][:1]}
+    assert '"count", [[1.0, ' in viz.create_html()
+    assert viz.color_stops is None
+
+    viz.data = {'type': 'FeatureCollection', 'features': []}
+    assert '"count", [[0, \'grey\']]' in viz.create_html()
+
+
+def test_HexbinViz_dataframe():
+    """Hexbin maps bin DataFrame columns at the starting zoom"""
+    df = pd.DataFrame({'lat': [0.0, 0.0001, 45.0], 'lon': [0.0, 0.0001, 10.0], 'value': [1, 2, 3]})
+    viz = HexbinViz(df, aggregate_property='value', zoom=6, color_property='sum',
+                    color_stops=[[0, 'red'], [3, 'blue']], access_token=TOKEN)
+    html = viz.create_html()
+    assert '"sum": 3.0' in html
+    assert 'hexZooms' not in html
+
+
+def test_thinning_CircleViz(data):
+    """Thinned circle layers filter points by the zoom level they are shown from"""
+    viz = CircleViz(data, thinning_radius=64, thinning_property='Avg Medicare Payments', access_token=TOKEN)
+    html = viz.create_html()
+    assert '"filter": ["<=", ["get", "lod_zoom"], ["zoom"]]' in html
+    assert html.count('"lod_zoom": 0') == 1
+
+    viz = GraduatedCircleViz(data, access_token=TOKEN)
+    assert '"lod_zoom"' not in viz.create_html()
+
+
+def test_simplify_geometry_ChoroplethViz(polygon_data):
+    """Simplified choropleths tile the source up to the map max_zoom"""
+    viz = ChoroplethViz(polygon_data, color_property='density', color_stops=[[0, 'red'], [100, 'blue']],
+                        simplify_geometry=True, max_zoom=3, access_token=TOKEN)
+    html = viz.create_html()
+    assert '"maxzoom": 3,\n            "tolerance": 0.375' in html
+    assert len(html) < len(ChoroplethViz(polygon_data, max_zoom=3, access_token=TOKEN).create_html())
+
+
+def test_simplify_geometry_LinestringViz(linestring_data):
+    viz = LinestringViz(linestring_data, simplify_geometry=True, source_tolerance=1, access_token=TOKEN)
+    assert '"maxzoom": 14,\n            "tolerance": 1' in viz.create_html()
+
+
+def test_bounds_CircleViz(data):
+    """Only features inside the bounds are embedded"""
+    viz = CircleViz(data, bounds=[-86, 31, -85, 32], access_token=TOKEN)
+    html = viz.create_html()
+    assert '10001' in html and '"Provider Id": 10005' not in html
+    assert viz.spatial_index.size == 3
+
+
+def test_bounds_view_ChoroplethViz(polygon_data):
+    viz = ChoroplethViz(polygon_data, bounds='view', center=(0, 0), zoom=12, access_token=TOKEN)
+    assert '"features": []' in viz.create_html()
+
+
+def test_data_server_CircleViz(data):
+    """Served maps start empty and load the tiles in view from the data server"""
+    server = DataServer()
+    try:
+        viz = CircleViz(data, data_server=server, access_token=TOKEN)
+        html = viz.create_html()
+        assert "loadViewportData('data', '{}/data/{}', 14, 300, 64)".format(server.url, viz.data_key) in html
+        assert '"data": {"type": "FeatureCollection", "features": []}' in html
+        assert server.datasets[viz.data_key][1] == data
+    finally:
+        server.shutdown()
+
+
+def test_progressive_CircleViz(data):
+    """Progressive maps embed a sample in the source and append the other features later"""
+    viz = CircleViz(data, progressive=True, progressive_sample=1, access_token=TOKEN)
+    html = viz.create_html()
+    assert "appendDataChunks('data', 1);" in html
+    assert html.count("<script type='application/json' id='data-chunk-") == 1
+
+    ordered = viz.progressive_order(data)
+    assert sorted(f['properties']['Provider Id'] for f in ordered['features']) == [0, 10001, 10005]
+    assert [len(part['features']) for part in viz.progressive_chunks(ordered)] == [1, 2]
+
+    viz = CircleViz(data, progressive=True, access_token=TOKEN)
+    assert "appendDataChunks('data'" not in viz.create_html()
+
+    for kwargs in [dict(worker_parsing=True), dict(data_compression='gzip')]:
+        viz = CircleViz(data, progressive=True, access_token=TOKEN, **kwargs)
+        with pytest.raises(ValueError):
+            viz.create_html()
+
+
+def test_frames_CircleViz(data):
+    """Frame values are embedded once and the first frame is set as the animated property"""
+    values = numpy.array([[1.0, 2.0, 3.0], [4.0, numpy.nan, 6.0]])
+    viz = CircleViz(data,
+                    color_property='reading',
+                    color_stops=[[0, 'blue'], [10, 'red']],
+                    frame_values=values,
+                    frame_labels=numpy.array(['2018-01-01T00:00', '2018-01-01T01:00'], dtype='datetime64[m]'),
+                    access_token=TOKEN)
+    html = viz.create_html()
+    assert "animateFrames('data', 'reading', [\"2018-01-01 00:00\", \"2018-01-01 01:00\"], 500);" in html
+    payload = json.loads(html.split("<script type='application/json' id='frame-values'>")[1].split('</script>')[0])
+    assert (payload['frames'], payload['features']) == (2, 3)
+    assert '"reading": 1.0' in html
+
+    with pytest.raises(ValueError):
+        CircleViz(data, color_property='reading', frame_values=values[:, :2], access_token=TOKEN).create_html()
+
+    # no animated property, or one the layers do not read
+    with pytest.raises(ValueError):
+        CircleViz(data, frame_values=values, access_token=TOKEN).create_html()
+    with pytest.raises(ValueError):
+        GraduatedCircleViz(data, color_property='reading', color_stops=[[0, 'blue'], [10, 'red']],
+                           radius_property='reading', radius_stops=[[0, 1], [10, 5]], bake_style=True,
+                           frame_values=values, access_token=TOKEN).create_html()
+
+    # clustered and heatmap layers do not read per-feature frame values from feature state
+    with pytest.raises(ValueError):
+        ClusteredCircleViz(data, frame_values=values, frame_property='w', access_token=TOKEN).create_html()
+    with pytest.raises(ValueError):
+        HeatmapViz(data, frame_values=values, frame_property='w', access_token=TOKEN).create_html()
+
+
+def test_filter_properties_CircleViz(data):
+    """Filter properties are kept in the source and indexed in a script block"""
+    viz = CircleViz(data,
+                    filter_properties=['Avg Total Payments'],
+                    popup_properties=['Provider Id'],
+                    access_token=TOKEN)
+    html = viz.create_html()
+    assert "addBinFilters('data', 10000);" in html
+    index = json.loads(html.split("<script type='application/json' id='filter-index'>")[1].split('</script>')[0])
+    assert index['count'] == 3
+    assert index['dimensions'][0]['property'] == 'Avg Total Payments'
+    assert '"Avg Total Payments"' in html.split("map.addSource")[1].split("map.addLayer")[0]
+
+    # features of clustered and heatmap layers cannot be hidden one by one
+    with pytest.raises(ValueError):
+        ClusteredCircleViz(data, filter_properties=['Avg Total Payments'], access_token=TOKEN).create_html()
+    with pytest.raises(ValueError):
+        HeatmapViz(data, filter_properties=['Avg Total Payments'], access_token=TOKEN).create_html()
+
+
+def test_filter_properties_ChoroplethViz(polygon_data):
+    """Flat choropleths hide filtered features by fill opacity, which extrusions cannot set per feature"""
+    viz = ChoroplethViz(polygon_data, color_property='density', color_stops=[[0, 'red'], [1000, 'blue']],
+                        filter_properties=['density'], access_token=TOKEN)
+    assert "addBinFilters('data'" in viz.create_html()
+
+    viz = ChoroplethViz(polygon_data, color_property='density', color_stops=[[0, 'red'], [1000, 'blue']],
+                        height_property='density', height_stops=[[0, 0], [1000, 10000]],
+                        filter_properties=['density'], access_token=TOKEN)
+    with pytest.raises(ValueError):
+        viz.create_html()
+
+
+def test_worker_parsing_CircleViz(data):
+    """Worker parsing embeds the data base64-encoded in a script block and starts with an empty source"""
+    def source_data(viz):
+        # the payload must survive the quote swap of the iframe shown in notebooks
+        html = viz.as_iframe(viz.create_html())
+        block = html.split("<script type='application/json' id='source-data'>")[1].split('</script>')[0]
+        return json.loads(base64.b64decode(block).decode('utf-8'))
+
+    viz = CircleViz(data, worker_parsing=True, access_token=TOKEN)
+    html = viz.create_html()
+    assert "\"data\": loadWorkerData('data', 'source-data', false)," in html
+    assert source_data(viz)['features'][0]['properties'] == data['features'][0]['properties']
+
+    viz = CircleViz(data, worker_parsing=True, data_encoding='columnar', access_token=TOKEN)
+    html = viz.create_html()
+    assert "loadWorkerData('data', 'source-data', true)" in html
+    assert "decodeGeoJSON({" not in html
+    assert source_data(viz)['encoding'] == 'columnar'
+
+    viz = CircleViz(data, worker_parsing=True, data_compression='gzip', access_token=TOKEN)
+    html = viz.create_html()
+    assert "id='source-data'" not in html
+    assert "inflateGeoJSON('data'" in html
@@ -0,0 +1,166 @@
+import json
+
+import numpy
+import pandas as pd
+import pytest
+
+from mapboxgl.live import (LiveConnection, data_message, paint_message, handle_comm_open, _connections, match_keys,
+                           diff_rows, row_hashes, has_duplicates)
+from mapboxgl.viz import CircleViz, HeatmapViz
+
+
+TOKEN = 'pk.abc123'
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+class MockComm(object):
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.close_callback = None
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def on_close(self, callback):
+        self.close_callback = callback
+
+    def close(self):
+        self.closed = True
+
+
+def test_data_message(data):
+    message = data_message(data, precision=2)
+    assert message['method'] == 'setData'
+    assert message['source'] == 'data'
+    assert json.loads(message['data'])['features'][0]['geometry']['coordinates'] == [-85.36, 31.22]
+
+    message = data_message(data, encoding='columnar', property_tables={'type': ['a']})
+    assert json.loads(message['data'])['encoding'] == 'columnar'
+    assert message['propertyTables'] == {'type': ['a']}
+
+
+def test_LiveConnection_queue(data):
+    connection = LiveConnection('key')
+    connection.send(paint_message('circle', 'circle-opacity', 0.5))
+    connection.send(data_message(data))
+    connection.send(data_message(data, precision=1))
+    assert [m['method'] for m in connection.pending] == ['setPaintProperty', 'setData']
+
+    comm = MockComm()
+    connection.open(comm)
+    assert connection.connected and connection.pending == []
+    assert comm.sent[1]['data'] == data_message(data, precision=1)['data']
+
+    connection.send(paint_message('circle', 'circle-radius', 2))
+    assert comm.sent[-1] == {'method': 'setPaintProperty', 'layer': 'circle', 'name': 'circle-radius', 'value': 2}
+
+    comm.close_callback({})
+    assert not connection.connected
+
+
+def test_handle_comm_open():
+    connection = LiveConnection('open-key')
+    _connections['open-key'] = connection
+    comm = MockComm()
+    handle_comm_open(comm, {'content': {'data': {'key': 'open-key'}}})
+    assert connection.comm is comm
+
+    unknown = MockComm()
+    handle_comm_open(unknown, {'content': {'data': {'key': 'other'}}})
+    assert unknown.closed
+    del _connections['open-key']
+
+
+def test_update_data_CircleViz(data):
+    viz = CircleViz(data, live=True, popup_properties=['Provider Id'], access_token=TOKEN)
+    assert "connectLiveUpdates('{}');".format(viz.data_key) in viz.create_html()
+
+    data['features'] = data['features'][:1]
+    viz.update_data(data)
+    viz.set_paint_property('circle', 'circle-opacity', 0.5)
+    message, paint = viz.connection.pending
+    features = json.loads(message['data'])['features']
+    assert len(features) == 1
+    assert list(features[0]['properties']) == ['Provider Id']
+    assert paint['value'] == 0.5
+
+    with pytest.raises(ValueError):
+        CircleViz(data, access_token=TOKEN).update_data(data)
+
+    # codes of a new encoding would not match the string tables the map styles were built with
+    with pytest.raises(ValueError):
+        CircleViz(data, live=True, dictionary_encoding=True, access_token=TOKEN).update_data(data)
+
+    # served tiles, frame values, filter bitsets and density images are built for the data of the map
+    for viz in [CircleViz(data, live=True, data_server=True, access_token=TOKEN),
+                CircleViz(data, live=True, frame_values=[[1.0]], frame_property='reading', access_token=TOKEN),
+                CircleViz(data, live=True, filter_properties=['Provider Id'], access_token=TOKEN),
+                HeatmapViz(data, live=True, density_zooms=[4], access_token=TOKEN)]:
+        with pytest.raises(ValueError):
+            viz.update_data(data)
+
+
+def test_match_keys():
+    assert match_keys([5, 3, 9], [9, 4, 5]).tolist() == [2, -1, 0]
+    assert match_keys(['b', 'a'], ['a', 'c']).tolist() == [1, -1]
+    assert match_keys([], [1, 2]).tolist() == [-1, -1]
+
+
+def test_has_duplicates():
+    assert not has_duplicates([3, 1, 2])
+    assert has_duplicates([3, 1, 3])
+    assert has_duplicates(['a', None, 'a'])
+    assert not has_duplicates(['a', None, 1])
+
+
+def test_diff_rows():
+    df = pd.DataFrame({'id': [1, 2, 3], 'value': [0.5, 1.5, 2.5]})
+    updated = pd.DataFrame({'id': [4, 3, 2], 'value': [0.0, 2.5, 9.0]})
+    positions, changed, removed = diff_rows(*(row_hashes(df, 'id') + row_hashes(updated, 'id')))
+    assert positions.tolist() == [-1, 2, 1]
+    assert changed.tolist() == [0, 2]
+    assert removed.tolist() == [1]
+
+
+def test_update_data_patch(data):
+    viz = CircleViz(data, live=True, access_token=TOKEN)
+    viz.update_data(data, key='Provider Id')
+    assert viz.connection.pending[0]['keys'] == [10001, 10005, 0]
+
+    data = json.loads(json.dumps(data))
+    data['features'][1]['properties']['Avg Total Payments'] = 0
+    del data['features'][2]
+    viz.update_data(data, key='Provider Id')
+    patch = viz.connection.pending[-1]
+    assert patch['method'] == 'patch'
+    assert patch['keys'] == [10005] and patch['remove'] == [0]
+    assert json.loads(patch['data'])['features'][0]['properties']['Avg Total Payments'] == 0
+
+    # unchanged data sends nothing
+    viz.update_data(data, key='Provider Id')
+    assert len(viz.connection.pending) == 2
+
+    data['features'].append(data['features'][0])
+    with pytest.raises(ValueError):
+        viz.update_data(data, key='Provider Id')
+
+
+def test_update_data_patch_dataframe():
+    df = pd.DataFrame({'id': numpy.arange(4), 'lat': [30.0, 31, 32, 33], 'lon': [-90.0, -89, -88, -87],
+                       'value': [1, 2, 3, 4]})
+    viz = CircleViz({'type': 'FeatureCollection', 'features': []}, live=True, access_token=TOKEN)
+    viz.update_data(df, key='id')
+
+    updated = df.copy()
+    updated.loc[3, 'value'] = 40
+    viz.update_data(updated.iloc[1:], key='id')
+    patch = viz.connection.pending[-1]
+    assert patch['keys'] == [3] and patch['remove'] == [0]
+    assert [f['properties']['value'] for f in viz.data['features']] == [2, 3, 40]
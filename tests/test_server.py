@@ -0,0 +1,59 @@
+import json
+
+import pytest
+import requests
+
+from mapboxgl.server import DataServer
+
+
+@pytest.fixture()
+def data():
+    with open('tests/points.geojson') as fh:
+        return json.loads(fh.read())
+
+
+@pytest.fixture()
+def server():
+    server = DataServer()
+    yield server
+    server.shutdown()
+
+
+def test_DataServer_chunk(server, data):
+    server.add(data, key='points')
+    world = json.loads(server.chunk('points', 0, 0, 0))
+    assert world['index'] == [0, 1]
+    assert world['data']['features'] == data['features'][:2]
+
+    # the points are in Alabama and Mississippi, in the western half of tile 2/1/1
+    assert json.loads(server.chunk('points', 1, 1, 2))['index'] == [0, 1, 2]
+    assert json.loads(server.chunk('points', 2, 1, 2))['index'] == []
+    assert server.chunk('missing', 0, 0, 0) is None
+
+
+def test_DataServer_zooms(data):
+    """Points are thinned per zoom level and tiles are capped, keeping the points of lower zoom levels"""
+    server = DataServer(max_tile_features=1)
+    server.add(data, key='points')
+    assert server.feature_zooms(data).tolist() == [0, 0, 2]
+    assert json.loads(server.chunk('points', 1, 1, 2))['index'] == [0]
+    server.shutdown()
+
+    server = DataServer(thinning_radius=0)
+    server.add(data, key='points')
+    assert json.loads(server.chunk('points', 0, 0, 0))['index'] == [0, 1, 2]
+    server.shutdown()
+
+
+def test_DataServer_http(server, data):
+    """Tiles are served over HTTP on localhost"""
+    url = server.add(data, encoding='delta', precision=3)
+    response = requests.get(url + '/0/0/0.json')
+    assert response.status_code == 200
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+    chunk = response.json()
+    assert chunk['data']['encoding'] == 'delta'
+    assert chunk['data']['features'][0]['geometry']['coordinates'] == [-85363, 31216]
+
+    assert requests.get(url + '/0/0/0').status_code == 404
+    assert requests.get(server.url + '/data/missing/0/0/0.json').status_code == 404
@@ -11,7 +11,7 @@ from mapboxgl.errors import SourceDataError, DateConversionError
 from mapboxgl.utils import (df_to_geojson, geojson_to_dict_list, scale_between, create_radius_stops,
                             create_weight_stops, create_numeric_stops, create_color_stops, 
                             img_encode, rgb_tuple_from_str, color_map, height_map, numeric_map,
-                            convert_date_columns)
+                            color_map_array, numeric_map_array, convert_date_columns, frame_matrix)
 
 
 @pytest.fixture()
@@ -42,17 +42,19 @@ def test_df_no_properties(df_no_properties):
     assert tuple(features[0]['properties'].keys()) == ()
 
 
-def test_df_geojson_file(df):
-    features = df_to_geojson(df, filename='out.geojson')
-    with open('out.geojson', 'r') as f:
+def test_df_geojson_file(df, tmpdir):
+    filename = str(tmpdir.join('out.geojson'))
+    features = df_to_geojson(df, filename=filename)
+    with open(filename, 'r') as f:
         testdata = json.load(f)
     assert len(testdata['features']) == 3
 
 
-def test_df_geojson_file_nonsequential_index(df):
+def test_df_geojson_file_nonsequential_index(df, tmpdir):
     df.set_index('Avg Total Payments', inplace=True)
-    features = df_to_geojson(df, filename='out.geojson')
-    with open('out.geojson', 'r') as f:
+    filename = str(tmpdir.join('out.geojson'))
+    features = df_to_geojson(df, filename=filename)
+    with open(filename, 'r') as f:
         testdata = json.load(f)
     assert len(testdata['features']) == 3
 
@@ -238,6 +240,26 @@ def test_height_map_exact():
     assert height_map(50.0, stops, 42) == 5000.0
 
 
+def test_color_map_array_interp():
+    """Compute colors for an array of lookup values by interpolation of color stops"""
+    interp_stops = [[0.0, 'rgb(255,0,0)'], [50.0, 'rgb(255,255,0)'], [1000.0, 'rgb(0,0,255)']]
+    assert color_map_array([17, -5, 2000, None, 'CA'], interp_stops, 'orange') == \
+        ['#ff5700', '#ff0000', '#0000ff', 'orange', 'orange']
+
+
+def test_color_map_array_match():
+    """Look up colors for an array of values in categorical color stops"""
+    match_stops = [['CA', 'rgb(255,0,0)'], ['NY', 'rgb(255,255,0)']]
+    assert color_map_array(['NY', 'MI'], match_stops, 'gray', 'match') == ['rgb(255,255,0)', 'gray']
+
+
+def test_numeric_map_array():
+    """Compute numbers for an array of lookup values by interpolation of numeric stops"""
+    stops = [[0.0, 0], [50.0, 5000.0], [1000.0, 100000.0]]
+    assert numeric_map_array([25, 50.0, 5000, None], stops, 42) == [2500.0, 5000.0, 100000.0, 42]
+    assert numeric_map_array(['a', 'b'], [['a', 3]], 1, 'match') == [3, 1]
+
+
 def test_geojson_to_dict_list_json(df):
     """Ensure data converted to Python dict"""
     data = json.loads(df.to_json(orient='records'))
@@ -282,3 +304,18 @@ def test_convert_date_columns_error(df):
     with pytest.raises(DateConversionError):
         convert_date_columns(df, date_format='')
 
+
+
+def test_df_geojson_precision(df):
+    features = df_to_geojson(df, precision=2)['features']
+    assert features[0]['geometry']['coordinates'] == [-85.36, 31.22]
+
+
+def test_frame_matrix():
+    """Pivot readings per feature and time to a matrix of frames x features"""
+    readings = pd.DataFrame({'station': ['B', 'A', 'B', 'C', 'X'],
+                             'hour': [2, 1, 1, 2, 1],
+                             'temp': [20.0, 10.0, 15.0, 5.0, 99.0]})
+    times, matrix = frame_matrix(readings, ['A', 'B', 'C'], key='station', time='hour', value='temp')
+    assert times.tolist() == [1, 2]
+    numpy.testing.assert_array_equal(matrix, [[10.0, 15.0, numpy.nan], [numpy.nan, 20.0, 5.0]])